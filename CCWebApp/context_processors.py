@@ -0,0 +1,44 @@
+"""
+Template context processors for the project, and the version that keys its cached fragments.
+
+Cached fragments ({% cache %} in base.html and inventory.html, CachedSelect in users/forms.py)
+live in a cache shared across workers and restarts, with a long timeout. So that a deploy which
+edits their markup doesn't keep serving the previous release's HTML until the timeout, every
+fragment key includes template_version(): a hash of the project's own templates and the Django
+version (whose widget templates CachedSelect renders). A new release gets new keys, and the old
+entries simply expire.
+"""
+import hashlib
+import os
+from functools import lru_cache
+
+import django
+from django.conf import settings
+from django.template.utils import get_app_template_dirs
+
+
+@lru_cache(maxsize=None)
+def template_version():
+    """Returns a short hash of the project's templates and the Django version, computed once per process."""
+    digest = hashlib.sha1(django.get_version().encode())
+    base_dir = str(settings.BASE_DIR)
+    template_dirs = [str(path) for path in get_app_template_dirs('templates') if str(path).startswith(base_dir)]
+    for template_setting in settings.TEMPLATES:
+        template_dirs += [str(path) for path in template_setting.get('DIRS', [])]
+    for template_dir in sorted(set(template_dirs)):
+        for dirpath, dirnames, filenames in os.walk(template_dir):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                digest.update(os.path.relpath(path, template_dir).encode())
+                with open(path, 'rb') as file:
+                    digest.update(file.read())
+    return digest.hexdigest()[:12]
+
+
+def fragment_cache(request):
+    """Exposes the timeout and version used by the {% cache %} tags in base.html and inventory.html."""
+    return {
+        'TEMPLATE_FRAGMENT_TIMEOUT': settings.TEMPLATE_FRAGMENT_TIMEOUT,
+        'TEMPLATE_FRAGMENT_VERSION': template_version(),
+    }
@@ -0,0 +1,126 @@
+"""
+Import-time benchmark for process startup.
+
+Boots Django in a fresh interpreter under ``python -X importtime``, parses the per-module
+timings it prints to stderr and reports the total import time, the slowest modules and
+whether any of the heavy dependencies that should only load on first use (see
+CCWebApp/lazy_imports.py) were imported during boot.
+
+Run it from the project root:
+    python -m CCWebApp.importtime            # report
+    python -m CCWebApp.importtime --top 40   # longer report
+
+The budget tests in inventory/tests.py use the same measurement.
+"""
+import argparse
+import subprocess
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# What a cold worker or manage.py command does before it can serve or run anything
+BOOT_SNIPPET = (
+    "import os, django;"
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'CCWebApp.settings');"
+    "django.setup();"
+    "import inventory.urls, inventory.models, inventory.admin, users.models"
+)
+
+# Packages that must not be imported while booting
+HEAVY_PACKAGES = ('boto3', 'botocore', 's3transfer', 'PIL')
+
+# Budget for the total boot import time, in milliseconds
+IMPORT_TIME_BUDGET_MS = 1000
+
+ImportRecord = namedtuple('ImportRecord', ['module', 'self_us', 'cumulative_us', 'depth'])
+
+
+def parse_importtime(output):
+    """Parses the stderr of ``python -X importtime`` into a list of ImportRecords.
+
+    Lines look like ``import time:       412 |       1234 |     package.module``, where the
+    indentation of the module name gives its nesting depth.
+    """
+    records = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        except ValueError:
+            continue
+        module = name.strip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        records.append(ImportRecord(module, int(self_us), int(cumulative_us), depth))
+    return records
+
+
+class ImportReport:
+    """The parsed result of one measured interpreter run."""
+
+    def __init__(self, records):
+        self.records = records
+        self.modules = {record.module for record in records}
+
+    @property
+    def total_ms(self):
+        # top-level imports include everything they pulled in, so summing them counts each module once
+        return sum(record.cumulative_us for record in self.records if record.depth == 0) / 1000
+
+    def heavy_modules(self, packages=HEAVY_PACKAGES):
+        """Returns the imported modules that belong to one of the heavy packages."""
+        return sorted(
+            module for module in self.modules
+            if any(module == package or module.startswith(package + '.') for package in packages)
+        )
+
+    def slowest(self, top=20):
+        return sorted(self.records, key=lambda record: record.cumulative_us, reverse=True)[:top]
+
+    def format(self, top=20):
+        lines = [f'Total boot import time: {self.total_ms:.1f} ms (budget {IMPORT_TIME_BUDGET_MS} ms)', '']
+        lines.append(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for record in self.slowest(top):
+            lines.append(f'{record.cumulative_us / 1000:>14.1f} {record.self_us / 1000:>9.1f}  {record.module}')
+        heavy = self.heavy_modules()
+        lines.append('')
+        if heavy:
+            lines.append(f'Heavy modules imported at boot ({len(heavy)}): ' + ', '.join(heavy[:10]))
+        else:
+            lines.append('No heavy modules imported at boot: ' + ', '.join(HEAVY_PACKAGES))
+        return '\n'.join(lines)
+
+
+def measure(snippet=BOOT_SNIPPET, repeat=3, python=sys.executable):
+    """Runs `snippet` in fresh interpreters under -X importtime and returns the fastest run's ImportReport.
+
+    The fastest of several runs is used so the number reflects import cost rather than
+    noise (the first run may also be paying for writing .pyc files).
+    """
+    reports = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [python, '-X', 'importtime', '-c', snippet],
+            cwd=BASE_DIR, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f'Boot snippet failed:\n{result.stderr[-2000:]}')
+        reports.append(ImportReport(parse_importtime(result.stderr)))
+    return min(reports, key=lambda report: report.total_ms)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--top', type=int, default=20, help='Number of slowest modules to list.')
+    parser.add_argument('--repeat', type=int, default=3, help='Interpreter runs; the fastest one is reported.')
+    args = parser.parse_args(argv)
+
+    report = measure(repeat=args.repeat)
+    print(report.format(top=args.top))
+    return 0 if report.total_ms <= IMPORT_TIME_BUDGET_MS and not report.heavy_modules() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+Accessors for heavy third-party modules that are imported on first use instead of at module load.
+
+boto3/botocore and Pillow together add a large share of the project's import time. Most processes
+(manage.py commands, migrations, freshly forked workers) never touch S3 or decode an image before
+they serve their first request, so modules call these accessors inside the functions that need the
+library rather than importing it at the top of the file.
+
+Keep heavy imports out of module level in the apps; CCWebApp/importtime.py and the budget tests in
+inventory/tests.py check that booting Django doesn't load them.
+
+Example:
+    from CCWebApp.lazy_imports import pil_image
+
+    def make_thumbnail(fp):
+        Image = pil_image()
+        with Image.open(fp) as img:
+            ...
+"""
+import importlib
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _load(name):
+    return importlib.import_module(name)
+
+
+def boto3():
+    """Returns the boto3 module."""
+    return _load('boto3')
+
+
+def botocore_config():
+    """Returns the botocore.config module (for botocore_config().Config)."""
+    return _load('botocore.config')
+
+
+def dynamodb_types():
+    """Returns the boto3.dynamodb.types module (TypeSerializer, TypeDeserializer)."""
+    return _load('boto3.dynamodb.types')
+
+
+def pil_image():
+    """Returns the PIL.Image module."""
+    return _load('PIL.Image')
+
+
+def pil_image_ops():
+    """Returns the PIL.ImageOps module."""
+    return _load('PIL.ImageOps')
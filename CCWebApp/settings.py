@@ -37,7 +37,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'crispy_forms'
+    'crispy_forms',
     'inventory',
     'users',
 ]
@@ -60,18 +60,39 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
+        # APP_DIRS is replaced by the explicit loaders below
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'CCWebApp.context_processors.fragment_cache',
+            ],
+            # Parse each template once per process and reuse the compiled version on every render
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
 ]
 
+# Cache used for template fragments ({% cache %} in base.html and inventory.html) and the cached
+# select widgets in users/forms.py. Their keys include a hash of the templates, so a deploy starts
+# with fresh fragments (see CCWebApp/context_processors.py).
+# The cache has to be shared by every worker process, or an invalidation only reaches the worker
+# that made it: files work for one host, several hosts need a cache server (RedisCache/PyMemcacheCache).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'django_cache',
+    }
+}
+TEMPLATE_FRAGMENT_TIMEOUT = 60 * 60 * 24 # seconds, passed to the {% cache %} tags by CCWebApp.context_processors
+
 WSGI_APPLICATION = 'CCWebApp.wsgi.application'
 
 
@@ -134,6 +155,35 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles' # collectstatic writes the hashed, precompressed files here
+
+# collectstatic emits content-hashed file names (main.3f2a9c1e0b7d.css) plus .gz and .br copies,
+# so they can be served with far-future cache headers (see CCWebApp/static_storage.py)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'CCWebApp.static_storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# User uploaded files (profile pictures)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Inventory image upload limits, enforced from the image header before anything is sent to S3
+# (see inventory/image_validation.py)
+INVENTORY_MAX_IMAGE_BYTES = 10 * 1024 * 1024
+INVENTORY_MAX_IMAGE_PIXELS = 40_000_000
+
+# Local on-disk LRU cache used to serve inventory images back without an S3 GET per request
+# (see inventory/image_cache.py)
+INVENTORY_IMAGE_CACHE_DIR = BASE_DIR / 'image_cache'
+INVENTORY_IMAGE_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024 # 2 GB
+
+# Target train/val/test ratios per label for new items (see inventory/splits.py). Existing items keep their split.
+INVENTORY_SPLIT_RATIOS = {'train': 0.8, 'val': 0.1, 'test': 0.1}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -0,0 +1,72 @@
+"""
+Static files storage that fingerprints and precompresses assets at collectstatic time.
+
+ManifestStaticFilesStorage already writes every file under a content-hashed name
+(main.css -> main.3f2a9c1e0b7d.css) and rewrites {% static %} URLs to point at it, so a
+changed file always gets a new URL and the old one can be cached forever. On top of that,
+this writes a gzip (.gz) and, when the brotli package is installed, a brotli (.br) copy of
+every text asset next to the hashed file. The compression happens once per deploy instead
+of on every request; CCWebApp/static_views.py (or a front-end server with gzip_static /
+brotli_static) serves the smallest variant the client accepts.
+"""
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico')
+MIN_COMPRESS_SIZE = 256 # bytes, smaller files aren't worth the extra Content-Encoding round trip
+MIN_SAVING = 0.05 # keep a compressed copy only if it is at least 5% smaller
+
+
+def _brotli():
+    """Returns the brotli module, or None when the optional package isn't installed."""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also writes .gz and .br copies of the hashed files."""
+    manifest_strict = False # hash files missing from the manifest on the fly instead of raising
+
+    def stored_name(self, name):
+        # Without collectstatic there is neither a manifest nor a file to hash (tests, a deploy that
+        # skipped it); {% static %} then falls back to the unhashed name rather than failing the page.
+        # Those names are served with a short max-age, see CCWebApp/static_views.py.
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set() # the manifest storage makes several passes and may yield a file more than once
+        for name, hashed_name, processed in super().post_process(paths, dry_run=dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        brotli = _brotli()
+        for hashed_name in hashed_names:
+            if hashed_name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self.compress(hashed_name, brotli)
+
+    def compress(self, name, brotli=None):
+        """Writes name.gz (and name.br when brotli is available) next to a collected file."""
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))] # mtime=0: identical output on every deploy
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data, quality=11)))
+        for suffix, compressed in variants:
+            if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                with open(path + suffix, 'wb') as file:
+                    file.write(compressed)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix) # left over from an earlier deploy of a file that no longer compresses
@@ -0,0 +1,77 @@
+"""
+Serves collected static files with their precompressed variants and long-lived cache headers.
+
+Used when Django itself serves STATIC_ROOT (DEBUG off, no front-end server in the way).
+For each request it picks the .br or .gz copy written by CompressedManifestStaticFilesStorage
+when the client accepts that encoding, streams it with FileResponse and, for content-hashed
+file names, tells browsers and CDNs to keep it for a year without revalidating.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+# main.3f2a9c1e0b7d.css: the 12 hex digit hash ManifestStaticFilesStorage puts before the extension
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+UNHASHED_CACHE_CONTROL = 'public, max-age=300' # files referenced without {% static %} may change in place
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')] # in order of preference
+REFUSED = re.compile(r'q=0(\.0*)?$') # a q-value of zero means "not acceptable"
+
+
+def accepted_encodings(header):
+    """Returns the content codings an Accept-Encoding header allows (those not given q=0)."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if coding and not REFUSED.match(params.replace(' ', '')):
+            accepted.add(coding)
+    return accepted
+
+
+@require_safe
+def serve(request, path):
+    """
+    Serves one file from STATIC_ROOT.
+
+    Args:
+        request: The HTTP request object.
+        path: The path of the file relative to STATIC_ROOT.
+
+    Returns:
+        FileResponse, HttpResponseNotModified, or raises Http404.
+    """
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation: # the path escapes STATIC_ROOT
+        raise Http404('Static file not found')
+    if not os.path.isfile(full_path):
+        raise Http404('Static file not found')
+
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    served_path, encoding = full_path, None
+    for coding, suffix in ENCODINGS:
+        if coding in accepted and os.path.isfile(full_path + suffix):
+            served_path, encoding = full_path + suffix, coding
+            break
+
+    stat = os.stat(full_path)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        response = FileResponse(open(served_path, 'rb'), content_type=content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if HASHED_NAME.search(path) else UNHASHED_CACHE_CONTROL
+    return response
@@ -1,3 +1,156 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME, ActionForm
+from django.db import transaction
+from django.db.models import Count
+from django.template.response import TemplateResponse
+from .models import InventoryItem, SplitCount
+from .storage_backends import AWSStorageBackend
+
+
+DELETE_CONFIRMATION_SAMPLE = 20 # items listed on the delete confirmation page
+
+
+class RelabelActionForm(ActionForm):
+    """Adds a 'new label' box next to the admin action dropdown, used by the relabel action."""
+    new_label = forms.CharField(max_length=255, required=False, label='New label')
+
 
 # Register your models here.
+@admin.register(InventoryItem)
+class InventoryItemAdmin(admin.ModelAdmin):
+    """
+    Admin for InventoryItem, built for fixing labels in bulk.
+
+    - The changelist joins the uploading user in the same query (list_select_related) instead of one query per row.
+    - Per-label counts for the current filter are computed with a single GROUP BY and shown above the list.
+    - Relabel and delete run one SQL UPDATE/DELETE for the whole selection, then push the matching
+      DynamoDB updates and S3 deletes in batched, parallel calls (see AWSStorageBackend).
+    - The change form goes through the same paths: a label edit is pushed to DynamoDB and its Delete
+      button cleans up S3 and DynamoDB. Fields that mirror the S3 object can't be edited at all.
+    """
+    list_display = ('id', 'label', 'split', 'filename', 'user', 'timestamp', 'width', 'height')
+    list_filter = ('label', 'split')
+    search_fields = ('label', 'filename', 'user__username')
+    list_select_related = ('user',)
+    list_per_page = 100
+    show_full_result_count = False # skips an extra COUNT(*) over the whole table on filtered pages
+    action_form = RelabelActionForm
+    actions = ['relabel_selected', 'delete_selected_everywhere']
+    # the S3 key, the owner and the metadata read from the stored image describe the S3 object itself;
+    # the split is assigned once and counted in SplitCount, so it never changes either (see splits.py)
+    readonly_fields = ('filename', 'user', 'timestamp', 'width', 'height', 'image_format', 'byte_size', 'captured_at', 'split')
+
+    def has_add_permission(self, request):
+        return False # items are created by uploading an image, never from a bare form
+
+    def get_actions(self, request):
+        # Django's own delete_selected removes rows one at a time and leaves the S3 and DynamoDB copies behind
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context=extra_context)
+        try:
+            changelist = response.context_data['cl']
+        except (AttributeError, KeyError):
+            return response # a redirect or an action response, nothing to annotate
+        response.context_data['label_counts'] = (
+            changelist.queryset.order_by().values('label').annotate(count=Count('id')).order_by('-count', 'label')
+        )
+        return response
+
+    def save_model(self, request, obj, form, change):
+        if not change or 'label' not in form.changed_data:
+            super().save_model(request, obj, form, change)
+            return
+        old_label = form.initial['label']
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            if obj.split:
+                SplitCount.add(old_label, {obj.split: -1})
+                SplitCount.add(obj.label, {obj.split: 1})
+        if obj.filename:
+            try:
+                AWSStorageBackend().update_inventory_item(obj.filename, {'label': obj.label})
+            except Exception as e:
+                self.message_user(request, f'Saved the new label in the database, but DynamoDB was not updated: {e}', messages.ERROR)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, InventoryItem.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        """Deletes the rows, their split counts, DynamoDB items and S3 objects. Returns the number of rows deleted."""
+        filenames = [filename for filename in queryset.values_list('filename', flat=True) if filename]
+        with transaction.atomic():
+            for label, split, count in self.split_counts(queryset):
+                SplitCount.add(label, {split: -count})
+            # nothing references InventoryItem and it has no delete signals, so Django issues a single DELETE
+            deleted, _ = queryset.delete()
+        storage_backend = AWSStorageBackend()
+        try:
+            storage_backend.delete_inventory_items(filenames)
+            storage_backend.delete_files(filenames)
+        except Exception as e:
+            self.message_user(request, f'Deleted {deleted} items from the database, but S3/DynamoDB cleanup failed: {e}', messages.ERROR)
+        return deleted
+
+    @admin.action(description='Relabel selected items (enter the new label first)', permissions=['change'])
+    def relabel_selected(self, request, queryset):
+        new_label = request.POST.get('new_label', '').strip()
+        if not new_label:
+            self.message_user(request, 'Enter a new label before running the relabel action.', messages.WARNING)
+            return
+
+        filenames = [filename for filename in queryset.values_list('filename', flat=True) if filename]
+        with transaction.atomic():
+            moved = self.split_counts(queryset)
+            updated = queryset.update(label=new_label) # one UPDATE for the whole selection
+            # items keep their split, their counts move from the old label to the new one
+            for label, split, count in moved:
+                SplitCount.add(label, {split: -count})
+                SplitCount.add(new_label, {split: count})
+        try:
+            AWSStorageBackend().update_inventory_items(filenames, {'label': new_label})
+        except Exception as e:
+            self.message_user(request, f'Relabeled {updated} items in the database, but DynamoDB was not fully updated: {e}', messages.ERROR)
+            return
+        self.message_user(request, f'Relabeled {updated} items as "{new_label}".', messages.SUCCESS)
+
+    @admin.action(description='Delete selected items from the database, S3 and DynamoDB', permissions=['delete'])
+    def delete_selected_everywhere(self, request, queryset):
+        if request.POST.get('post') != 'yes':
+            # like Django's delete_selected: show what is about to go and post back with post=yes
+            return TemplateResponse(request, 'admin/inventory/inventoryitem/delete_selected_everywhere.html', {
+                **self.admin_site.each_context(request),
+                'title': 'Are you sure?',
+                'opts': self.model._meta,
+                'media': self.media,
+                'count': queryset.count(),
+                'sample': queryset.select_related('user').order_by('pk')[:DELETE_CONFIRMATION_SAMPLE],
+                'select_across': request.POST.get('select_across') == '1',
+                'selected': request.POST.getlist(ACTION_CHECKBOX_NAME),
+                'action_checkbox_name': ACTION_CHECKBOX_NAME,
+            })
+        deleted = self.delete_queryset(request, queryset)
+        self.message_user(request, f'Deleted {deleted} items from the database.', messages.SUCCESS)
+
+    def split_counts(self, queryset):
+        """Returns (label, split, count) for the items in the queryset that have a split, one GROUP BY."""
+        rows = queryset.exclude(split='').order_by().values('label', 'split').annotate(count=Count('id'))
+        return [(row['label'], row['split'], row['count']) for row in rows]
+
+
+@admin.register(SplitCount)
+class SplitCountAdmin(admin.ModelAdmin):
+    """Read-only view of how many items each label has in each split."""
+    list_display = ('label', 'split', 'count')
+    list_filter = ('split',)
+    search_fields = ('label',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
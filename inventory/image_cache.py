@@ -0,0 +1,256 @@
+"""Byte-bounded local read-through cache for inventory images stored in S3.
+
+Images are cached on local disk under their S3 key and evicted least recently
+used first once the total size of the cache directory goes over its byte budget.
+Objects in S3 are never overwritten (every upload gets a fresh uuid key), so a
+cached file never goes stale and a cache entry only has to be fetched once.
+
+Concurrent misses for the same key are coalesced: the first request fetches
+from S3 and every other request for that key waits for the same result instead
+of issuing its own GET.
+
+The directory itself is the index, so every worker process sharing it shares one
+budget. A hit stamps the file's mtime as its last use (one utime). A miss adds the
+new file's size to a running total kept in the lock file, under an exclusive file
+lock held for just that read and write. Only when the total crosses the budget is
+the directory scanned: the files used longest ago are deleted down to a low-water
+mark below the budget, and the total is re-synced with what is actually on disk.
+So scans happen once per tenth of the budget fetched, not once per miss.
+"""
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from io import BytesIO
+from urllib.parse import quote
+
+from django.conf import settings
+
+from CCWebApp.lazy_imports import pil_image, pil_image_ops
+from .storage_backends import AWSStorageBackend
+
+try:
+    import fcntl
+except ImportError: # not POSIX, processes can't lock the directory; threads still use the in-process lock
+    fcntl = None
+
+THUMBNAIL_SIZE = (256, 256)
+THUMBNAIL_SUFFIX = '@thumb'
+TEMP_PREFIX = '.tmp-' # partial downloads, dot-prefixed so scans skip them
+LOCK_FILE = '.lock' # also holds the running total of cached bytes
+LOW_WATER = 0.9 # eviction frees space down to this fraction of the budget, so the next scan is far off
+STALE_TEMP_SECONDS = 60 * 60 # a download still unfinished after an hour was left behind by a crashed process
+
+
+class LocalImageCache:
+    """On-disk LRU cache of S3 objects, bounded by the total bytes in its directory.
+
+    Args:
+        root: Directory holding the cached files, created if it doesn't exist.
+        max_bytes: Total size the cached files may take up before the least recently used ones are evicted.
+        storage_backend: Optional AWSStorageBackend, created on the first miss if not given.
+    """
+
+    def __init__(self, root, max_bytes, storage_backend=None):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self._storage_backend = storage_backend
+        self._lock = threading.Lock() # guards _in_flight; also serializes the running total between threads
+        self._in_flight = {} # cache key -> Future shared by every request waiting on that miss
+        self._total_bytes = 0 # as of the last update of the running total
+        os.makedirs(self.root, exist_ok=True)
+        self._remove_stale_temp_files()
+        with self._locked_total() as lock_file:
+            self._evict(lock_file) # re-syncs the total left by earlier processes with the directory
+
+    @property
+    def storage_backend(self):
+        if self._storage_backend is None:
+            self._storage_backend = AWSStorageBackend()
+        return self._storage_backend
+
+    @property
+    def total_bytes(self):
+        """The running total of cached bytes, as this process last saw it."""
+        return self._total_bytes
+
+    def _path(self, cache_key):
+        # S3 keys contain '/', quoting them gives one flat, reversible file name per key
+        return os.path.join(self.root, quote(cache_key, safe=''))
+
+    def _touch(self, path):
+        """Records a use of the file as its mtime, the LRU order every process sees."""
+        now = time.time_ns() # explicit, so the order doesn't depend on the filesystem's timestamp granularity
+        os.utime(path, ns=(now, now))
+
+    def _remove_stale_temp_files(self):
+        """Deletes partial downloads left behind by processes that crashed mid-fetch."""
+        cutoff = time.time() - STALE_TEMP_SECONDS
+        for entry in os.scandir(self.root):
+            if entry.name.startswith(TEMP_PREFIX):
+                try:
+                    if entry.stat().st_mtime < cutoff: # younger ones may still be written by a live process
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    @contextmanager
+    def _locked_total(self):
+        """Holds the in-process lock and an exclusive lock on the directory; yields the lock file."""
+        with self._lock, open(os.path.join(self.root, LOCK_FILE), 'a+') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX) # released when the file is closed
+            yield lock_file
+
+    def _write_total(self, lock_file, total):
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(total))
+        lock_file.flush()
+        self._total_bytes = total
+
+    def _add(self, size, keep):
+        """Adds a newly cached file to the running total, evicting if that crosses the budget."""
+        with self._locked_total() as lock_file:
+            lock_file.seek(0)
+            try:
+                total = int(lock_file.read() or 0) + size
+            except ValueError:
+                total = self.max_bytes + 1 # unreadable, force a scan to rebuild it
+            if total > self.max_bytes:
+                self._evict(lock_file, keep)
+            else:
+                self._write_total(lock_file, total)
+
+    def _evict(self, lock_file, keep=None):
+        """Scans the directory and deletes least recently used files until it is under the low-water mark.
+
+        Call inside _locked_total(), so two processes never both delete files to make room for
+        the same bytes. Writes the real total on disk back as the running total.
+        """
+        files = []
+        for entry in os.scandir(self.root):
+            if entry.name.startswith('.'):
+                continue # temp files and the lock file
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.is_file():
+                files.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        files.sort()
+        total = sum(size for _, _, size in files)
+        target = self.max_bytes * LOW_WATER if total > self.max_bytes else self.max_bytes
+        keep_name = quote(keep, safe='') if keep is not None else None
+        for _, name, size in files:
+            if total <= target:
+                break
+            if name == keep_name:
+                continue # a single file bigger than the whole budget is still served once
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._write_total(lock_file, total)
+
+    def _open_cached(self, cache_key):
+        """Returns (file, size) for a cached key, or None on a miss."""
+        path = self._path(cache_key)
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            self._touch(path)
+        except FileNotFoundError:
+            pass # evicted by another process since; the open file stays readable
+        return file, os.fstat(file.fileno()).st_size
+
+    def open(self, key, thumbnail=False):
+        """Opens the cached copy of an S3 object, fetching it on a miss.
+
+        Args:
+            key: The S3 key (InventoryItem.filename).
+            thumbnail: Return a JPEG thumbnail generated from the cached original instead.
+
+        Returns:
+            tuple: (open binary file object, size in bytes). The caller closes the file;
+            it stays readable even if the entry is evicted in the meantime.
+        """
+        cache_key = key + THUMBNAIL_SUFFIX if thumbnail else key
+        while True:
+            cached = self._open_cached(cache_key)
+            if cached is not None:
+                return cached
+
+            with self._lock:
+                future = self._in_flight.get(cache_key)
+                owner = future is None
+                if owner:
+                    future = self._in_flight[cache_key] = Future()
+
+            if not owner:
+                future.result() # re-raises the fetch error for every waiter
+                continue # loop back round to open the file the owner just cached
+
+            try:
+                if thumbnail:
+                    self._store(cache_key, lambda tmp: self._write_thumbnail(key, tmp))
+                else:
+                    self._store(cache_key, lambda tmp: self.storage_backend.download_file(key, tmp))
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(None)
+            finally:
+                with self._lock:
+                    del self._in_flight[cache_key]
+
+    def _store(self, cache_key, write):
+        """Runs `write` into a temp file, moves it into place and adds it to the running total."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                write(tmp)
+            self._touch(tmp_path)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._path(cache_key)) # atomic, readers never see a partial file
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self._add(size, keep=cache_key)
+
+    def _write_thumbnail(self, key, tmp):
+        """Writes a JPEG thumbnail of the (cached) original into `tmp`."""
+        original, _ = self.open(key)
+        with original, pil_image().open(original) as img:
+            img.draft('RGB', THUMBNAIL_SIZE) # JPEG only: decode at reduced scale instead of full resolution
+            thumb = pil_image_ops().exif_transpose(img) # apply the camera rotation so thumbnails display upright
+            thumb.thumbnail(THUMBNAIL_SIZE)
+            buffer = BytesIO()
+            thumb.convert('RGB').save(buffer, format='JPEG', quality=85)
+        tmp.write(buffer.getvalue())
+
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """Returns the process-wide LocalImageCache configured from settings."""
+    global _image_cache
+    if _image_cache is None:
+        with _image_cache_lock:
+            if _image_cache is None:
+                _image_cache = LocalImageCache(
+                    settings.INVENTORY_IMAGE_CACHE_DIR,
+                    settings.INVENTORY_IMAGE_CACHE_MAX_BYTES,
+                )
+    return _image_cache
@@ -0,0 +1,191 @@
+"""Header-only validation of uploaded inventory images.
+
+Uploads are identified with a lazy ``PIL.Image.open``, which parses the image
+header and stops before decoding any pixel data. Corrupt files, unsupported
+formats and images over the byte or pixel limits are therefore rejected before
+a single byte is sent to S3, and the stored extension and content type come
+from the real format instead of whatever ``file.name`` claims.
+"""
+import warnings
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from django.conf import settings
+
+from CCWebApp.lazy_imports import pil_image
+
+# Pillow format name -> (stored extension, content type)
+ALLOWED_FORMATS = {
+    'JPEG': ('.jpg', 'image/jpeg'),
+    'PNG': ('.png', 'image/png'),
+    'WEBP': ('.webp', 'image/webp'),
+}
+MAX_IMAGE_BYTES = 10 * 1024 * 1024 # 10 MB, a full-resolution phone JPEG is well under this
+MAX_IMAGE_PIXELS = 40_000_000 # ~40 megapixels
+
+# EXIF tags read from the header
+EXIF_ORIENTATION = 0x0112
+EXIF_DATETIME = 0x0132
+EXIF_DATETIME_ORIGINAL = 0x9003
+EXIF_IFD = 0x8769
+
+
+class ImageValidationError(Exception):
+    """Raised when an uploaded file is not an acceptable inventory image."""
+    status_code = 400
+
+
+class ImageTooLargeError(ImageValidationError):
+    """Raised when an uploaded image exceeds the byte or pixel limits."""
+    status_code = 413
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    """What the header of a validated image tells us about it.
+
+    width and height are the displayed dimensions, i.e. swapped when the EXIF
+    orientation says the camera was rotated. captured_at is None when the
+    image carries no EXIF capture time.
+    """
+    format: str
+    width: int
+    height: int
+    byte_size: int
+    extension: str
+    content_type: str
+    captured_at: datetime = None
+
+    def as_metadata(self):
+        """Returns the fields stored on InventoryItem and in DynamoDB."""
+        return {
+            'width': self.width,
+            'height': self.height,
+            'image_format': self.format,
+            'byte_size': self.byte_size,
+            'captured_at': self.captured_at,
+        }
+
+
+@lru_cache(maxsize=None)
+def _pil_image():
+    """Returns PIL.Image, with its DecompressionBombWarning silenced for the whole process.
+
+    Pillow warns (rather than raises) on large images; our own pixel limit applies instead.
+    The filter is installed once here because warnings.catch_warnings() swaps the global
+    filters and is not thread-safe, and ingest_images validates from many threads at once.
+    """
+    Image = pil_image()
+    warnings.filterwarnings('ignore', category=Image.DecompressionBombWarning)
+    return Image
+
+
+def _file_size(file):
+    """Returns the size of ``file`` in bytes without reading its contents."""
+    size = getattr(file, 'size', None)
+    if size is not None:
+        return size
+    position = file.tell()
+    size = file.seek(0, 2)
+    file.seek(position)
+    return size
+
+
+def _parse_exif_datetime(value):
+    """Parses an EXIF 'YYYY:MM:DD HH:MM:SS' string, returning None if it is missing or malformed."""
+    if not isinstance(value, str):
+        return None
+    try:
+        # EXIF times carry no zone, store them as UTC like the rest of the app (USE_TZ)
+        return datetime.strptime(value.strip('\x00 '), '%Y:%m:%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def inspect_image_header(fp):
+    """Reads format, displayed dimensions and capture time from an image header.
+
+    Only the header is parsed (EXIF lives in the header for JPEG/WebP), pixel data
+    is never decoded, so this also works on a truncated prefix of the file such as
+    a ranged S3 GET.
+
+    Args:
+        fp: A binary file object positioned at the start of the image.
+
+    Returns:
+        tuple: (format, width, height, captured_at)
+
+    Raises:
+        ImageTooLargeError: If Pillow refuses the image as a decompression bomb.
+        ImageValidationError: If the header cannot be parsed.
+    """
+    Image = _pil_image()
+    try:
+        # Image.open is lazy: it reads the header only and never decodes pixel data here
+        with Image.open(fp) as img:
+            image_format = img.format
+            width, height = img.size
+            # Only use EXIF that the header already holds (JPEG/WebP, PNG with an early eXIf
+            # chunk). For other PNGs getexif() loads the whole image looking for a late chunk,
+            # which decodes every pixel and fails on a truncated prefix.
+            exif = img.getexif() if 'exif' in img.info else Image.Exif()
+            orientation = exif.get(EXIF_ORIENTATION)
+            captured_at = _parse_exif_datetime(
+                exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+            )
+    except Image.DecompressionBombError as e: # over twice Pillow's own pixel limit
+        raise ImageTooLargeError(f'Image has too many pixels: {e}')
+    except (Image.UnidentifiedImageError, OSError, SyntaxError, ValueError) as e:
+        raise ImageValidationError(f'File is not a readable image: {e}')
+
+    if orientation in (5, 6, 7, 8): # rotated 90 or 270 degrees
+        width, height = height, width
+    return image_format, width, height, captured_at
+
+
+def validate_image(file):
+    """Validates an uploaded image by reading only its header.
+
+    Args:
+        file: The uploaded file object (e.g. from ``request.FILES``).
+
+    Returns:
+        ImageInfo: The detected format, dimensions, size, capture time and storage details.
+
+    Raises:
+        ImageTooLargeError: If the file exceeds the byte or pixel limits.
+        ImageValidationError: If the file is not a readable image in an allowed format.
+    """
+    allowed_formats = getattr(settings, 'INVENTORY_ALLOWED_IMAGE_FORMATS', ALLOWED_FORMATS)
+    max_bytes = getattr(settings, 'INVENTORY_MAX_IMAGE_BYTES', MAX_IMAGE_BYTES)
+    max_pixels = getattr(settings, 'INVENTORY_MAX_IMAGE_PIXELS', MAX_IMAGE_PIXELS)
+
+    # Check the byte size first, it doesn't need to touch the file contents at all
+    byte_size = _file_size(file)
+    if byte_size > max_bytes:
+        raise ImageTooLargeError(f'Image is {byte_size} bytes, the limit is {max_bytes} bytes')
+    if byte_size == 0:
+        raise ImageValidationError('Image file is empty')
+
+    file.seek(0)
+    try:
+        image_format, width, height, captured_at = inspect_image_header(file)
+    finally:
+        file.seek(0) # rewind so the upload to S3 starts from the first byte
+
+    if image_format not in allowed_formats:
+        raise ImageValidationError(f'Unsupported image format: {image_format}')
+    if width * height > max_pixels:
+        raise ImageTooLargeError(f'Image is {width}x{height} pixels, the limit is {max_pixels} pixels')
+
+    extension, content_type = allowed_formats[image_format]
+    return ImageInfo(
+        format=image_format,
+        width=width,
+        height=height,
+        byte_size=byte_size,
+        extension=extension,
+        content_type=content_type,
+        captured_at=captured_at,
+    )
@@ -0,0 +1,68 @@
+"""
+Management command that gives a train/val/test split to inventory items stored before splits existed.
+
+New items get their split when they are stored (see inventory/splits.py); this assigns one, the same
+way and in id order, to the older items that have none, and mirrors it into DynamoDB. Items that
+already have a split are never touched.
+
+--recount rebuilds the SplitCount table from the items themselves, e.g. after rows were deleted
+outside the admin (a cascade from a deleted user).
+
+Usage:
+    python manage.py assign_splits --batch-size 1000
+    python manage.py assign_splits --recount
+"""
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from inventory.models import InventoryItem, SplitCount
+from inventory.storage_backends import AWSStorageBackend
+
+
+class Command(BaseCommand):
+    help = 'Assigns splits to items that have none, or rebuilds the per-(label, split) counts with --recount.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Items assigned per transaction.')
+        parser.add_argument('--recount', action='store_true', help='Rebuild SplitCount from InventoryItem instead.')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.recount()
+            return
+
+        storage_backend = AWSStorageBackend()
+        pending = InventoryItem.objects.filter(split='').exclude(filename='').order_by('id')
+        last_id = 0
+        assigned = 0
+        while True:
+            batch = list(pending.filter(id__gt=last_id).only('id', 'label', 'filename', 'split')[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            with transaction.atomic():
+                SplitCount.assign(batch)
+                InventoryItem.objects.bulk_update(batch, ['split'])
+
+            by_split = defaultdict(list)
+            for item in batch:
+                by_split[item.split].append(item.filename)
+            for split, filenames in by_split.items():
+                storage_backend.update_inventory_items(filenames, {'split': split})
+            assigned += len(batch)
+            self.stdout.write(f'{assigned} items assigned')
+
+        self.stdout.write(self.style.SUCCESS(f'Split assignment finished: {assigned} items assigned'))
+
+    def recount(self):
+        rows = (
+            InventoryItem.objects.exclude(split='').order_by()
+            .values('label', 'split').annotate(count=Count('id'))
+        )
+        with transaction.atomic():
+            SplitCount.objects.all().delete()
+            SplitCount.objects.bulk_create([SplitCount(**row) for row in rows])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {SplitCount.objects.count()} split counts'))
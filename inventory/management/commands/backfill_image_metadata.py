@@ -0,0 +1,112 @@
+"""
+Management command that fills in image metadata for inventory items uploaded before it was captured at ingest.
+
+Only the first few KB of each S3 object are fetched with a ranged GET, which is enough for
+PIL to read the format, dimensions and EXIF block from the header. Fetches (and the matching
+DynamoDB updates) run in parallel and the SQL rows are written back with bulk_update, one
+batch at a time. A row is only filled in once its DynamoDB item was updated too, so items whose
+DynamoDB write failed stay pending and are retried by the next run.
+
+Usage:
+    python manage.py backfill_image_metadata --workers 32 --batch-size 500
+"""
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+
+from inventory.image_validation import ImageValidationError, inspect_image_header
+from inventory.models import InventoryItem
+from inventory.storage_backends import AWSStorageBackend
+
+METADATA_FIELDS = ['width', 'height', 'image_format', 'byte_size', 'captured_at']
+MAX_HEADER_BYTES = 1024 * 1024 # give up on headers bigger than this (huge embedded EXIF thumbnails)
+
+# read_metadata outcomes
+UPDATED = 'updated'
+UNREADABLE = 'unreadable'
+DYNAMODB_FAILED = 'dynamodb_failed'
+
+
+class Command(BaseCommand):
+    help = 'Fills in width, height, format, byte size and capture time for items that are missing them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16, help='Number of parallel S3 requests.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of items updated per bulk_update.')
+        parser.add_argument('--header-bytes', type=int, default=64 * 1024, help='Bytes fetched per object on the first attempt.')
+
+    def handle(self, *args, **options):
+        self.storage_backend = AWSStorageBackend() # boto3 clients are thread-safe, one instance is shared by the workers
+        self.header_bytes = options['header_bytes']
+        batch_size = options['batch_size']
+
+        pending = InventoryItem.objects.filter(width__isnull=True).exclude(filename='').order_by('id')
+        last_id = 0
+        updated = failed = dynamodb_failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                # keyset pagination: rows leave the filter once updated, so paging by id keeps each query cheap
+                batch = list(pending.filter(id__gt=last_id).only('id', 'filename')[:batch_size])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                for item, (metadata, status) in zip(batch, executor.map(self.read_metadata, batch)):
+                    if status == DYNAMODB_FAILED:
+                        dynamodb_failed += 1
+                        continue # left unfilled in SQL too, so the next run retries the DynamoDB write
+                    if metadata is None:
+                        failed += 1
+                        continue
+                    for field, value in metadata.items():
+                        setattr(item, field, value)
+                    updated += 1
+                InventoryItem.objects.bulk_update([item for item in batch if item.width is not None], METADATA_FIELDS)
+                self.stdout.write(self.summary(updated, failed, dynamodb_failed))
+
+        message = f'Backfill finished: {self.summary(updated, failed, dynamodb_failed)}'
+        if dynamodb_failed:
+            self.stdout.write(self.style.WARNING(f'{message}. Run the command again to retry the DynamoDB updates.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
+
+    def summary(self, updated, failed, dynamodb_failed):
+        return f'{updated} items updated, {failed} unreadable, {dynamodb_failed} DynamoDB updates failed'
+
+    def read_metadata(self, item):
+        """Reads the metadata for one item from the head of its S3 object and writes it to DynamoDB.
+
+        Doubles the ranged GET until the header fits. Returns (metadata, status): metadata
+        is None if the object can't be read or isn't a parseable image, status is
+        DYNAMODB_FAILED if the metadata was read but the DynamoDB update failed.
+        """
+        length = self.header_bytes
+        while True:
+            try:
+                data, total_size = self.storage_backend.read_file_header(item.filename, length)
+            except Exception as e:
+                self.stderr.write(f'{item.filename}: {e}')
+                return None, UNREADABLE
+            try:
+                image_format, width, height, captured_at = inspect_image_header(BytesIO(data))
+            except ImageValidationError as e:
+                # a truncated header parses as garbage, retry with a longer range while there is more to read
+                if len(data) < total_size and length < MAX_HEADER_BYTES:
+                    length *= 2
+                    continue
+                self.stderr.write(f'{item.filename}: {e}')
+                return None, UNREADABLE
+            metadata = {
+                'width': width,
+                'height': height,
+                'image_format': image_format,
+                'byte_size': total_size,
+                'captured_at': captured_at,
+            }
+            try:
+                self.storage_backend.update_inventory_item(item.filename, metadata) # keep the DynamoDB copy in step
+            except Exception as e:
+                self.stderr.write(f'{item.filename}: DynamoDB update failed: {e}')
+                return metadata, DYNAMODB_FAILED
+            return metadata, UPDATED
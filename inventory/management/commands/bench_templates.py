@@ -0,0 +1,81 @@
+"""
+Management command that measures how long the main pages take to render.
+
+Each page is rendered once cold (template loader cache and fragment cache emptied first, as
+after a restart) and then --iterations times warm, through the same engine, context processors
+and request the views use. Nothing is written to the database: the pages are rendered for an
+unsaved user. The cold render empties the configured cache, which is shared by every worker,
+so run it against a staging or local cache rather than a busy production one.
+
+A page that fails to render (for instance the crispy-forms pages when the template pack is not
+installed) is reported with its error instead of timings, the other pages still run, and the
+command fails at the end.
+
+Usage:
+    python manage.py bench_templates --iterations 200
+"""
+import statistics
+import time
+
+from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+
+from users.forms import ProfileUpdateForm, UserRegisterForm, UserUpdateForm
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Renders the main pages cold and warm and reports the render times in milliseconds.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100, help='Warm renders per page.')
+
+    def handle(self, *args, **options):
+        user = User(pk=1, username='bench', email='bench@example.com')
+        user.profile = Profile(user=user)
+        pages = [
+            # (template, user the page is rendered for, context factory)
+            ('home.html', AnonymousUser(), dict),
+            ('inventory.html', user, dict),
+            ('users/login.html', AnonymousUser(), lambda: {'form': AuthenticationForm()}),
+            ('users/register.html', AnonymousUser(), lambda: {'form': UserRegisterForm()}),
+            ('users/profile.html', user, lambda: {'u_form': UserUpdateForm(instance=user), 'p_form': ProfileUpdateForm(instance=user.profile)}),
+        ]
+
+        failed = []
+        self.stdout.write(f"{'page':<22}{'cold ms':>10}{'warm mean ms':>15}{'warm p95 ms':>14}")
+        for template_name, page_user, context in pages:
+            request = RequestFactory().get('/')
+            request.user = page_user
+
+            self.reset_caches()
+            try:
+                cold = self.render(template_name, context, request)
+                warm = sorted(self.render(template_name, context, request) for _ in range(options['iterations']))
+            except Exception as e:
+                failed.append(template_name)
+                self.stdout.write(self.style.ERROR(f'{template_name:<22}{type(e).__name__}: {e}'))
+                continue
+            p95 = warm[min(len(warm) - 1, int(len(warm) * 0.95))]
+            self.stdout.write(f'{template_name:<22}{cold:>10.2f}{statistics.mean(warm):>15.2f}{p95:>14.2f}')
+
+        if failed:
+            raise CommandError(f"{len(failed)} of {len(pages)} pages failed to render: {', '.join(failed)}")
+
+    def reset_caches(self):
+        """Empties the compiled template cache and the fragment cache, as after a restart."""
+        for loader in engines['django'].engine.template_loaders:
+            if hasattr(loader, 'reset'):
+                loader.reset()
+        cache.clear()
+
+    def render(self, template_name, context, request):
+        """Returns the time in milliseconds one render of the page takes, form construction included."""
+        started = time.perf_counter()
+        render_to_string(template_name, context(), request=request)
+        return (time.perf_counter() - started) * 1000
@@ -0,0 +1,193 @@
+"""
+Management command that bulk-loads an archive of labeled photos organized as <root>/<label>/<file>.
+
+Each file is validated from its header (inventory/image_validation.py) and uploaded to S3 by a
+pool of worker threads. Finished uploads are collected into batches: one bulk_create for the SQL
+rows and batched, parallel batch_write_item calls for the DynamoDB items per batch.
+
+Progress is checkpointed to a JSON-lines state file after every batch, so an interrupted run
+picks up where it stopped. The state file belongs to one archive: its first line records the
+root, the default file name is derived from it, and resuming a different root is refused.
+
+S3 keys are derived from the file's path, size and modification time, so a file that was
+uploaded but not yet checkpointed goes to the same key on the next run, and rows already
+created for it are not created twice.
+
+Usage:
+    python manage.py ingest_images /data/photos --user alice --workers 32
+"""
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from inventory.image_validation import ImageValidationError, validate_image
+from inventory.models import InventoryItem, SplitCount
+from inventory.storage_backends import AWSStorageBackend
+
+# namespace for the uuid5 keys of ingested files, fixed so reruns produce the same keys
+INGEST_KEY_NAMESPACE = uuid.UUID('9b7f6f4e-2c1d-4c8e-9a43-6f0f3d1b2a57')
+
+
+class Command(BaseCommand):
+    help = 'Uploads a <label>/<file> directory tree of images as InventoryItems, resuming from a state file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('root', help='Directory with one sub-directory per label.')
+        parser.add_argument('--user', required=True, help='Username the items are created for.')
+        parser.add_argument('--workers', type=int, default=16, help='Parallel S3 uploads.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Items per bulk_create and checkpoint.')
+        parser.add_argument('--state-file', default=None, help='Checkpoint file (defaults to one per root in the current directory).')
+
+    def handle(self, *args, **options):
+        root = os.path.abspath(options['root'])
+        if not os.path.isdir(root):
+            raise CommandError(f'{root} is not a directory')
+        try:
+            self.user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+
+        state_path = options['state_file'] or self.default_state_path(root)
+        done = self.load_state(state_path, root)
+        if done:
+            self.stdout.write(f'Resuming: {len(done)} files already processed according to {state_path}')
+
+        self.storage_backend = AWSStorageBackend() # boto3 clients are thread-safe, one instance is shared by the workers
+        batch_size = options['batch_size']
+        max_in_flight = options['workers'] * 4 # bounds memory: the tree is walked lazily, not queued up front
+
+        self.started = time.monotonic()
+        self.created = self.failed = self.bytes_uploaded = 0
+        batch = []
+        with open(state_path, 'a', encoding='utf-8') as state, ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            if state.tell() == 0:
+                state.write(json.dumps({'root': root}) + '\n') # ties the checkpoint to this archive
+            in_flight = set()
+            for path, label in self.walk(root, done, os.path.abspath(state_path)):
+                if len(in_flight) >= max_in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    batch += [future.result() for future in finished]
+                    if len(batch) >= batch_size:
+                        self.flush(batch, state)
+                        batch = []
+                in_flight.add(executor.submit(self.upload, root, path, label))
+            batch += [future.result() for future in wait(in_flight).done]
+            self.flush(batch, state)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Ingest finished: {self.created} items created, {self.failed} files rejected in {time.monotonic() - self.started:.0f}s'
+        ))
+
+    def default_state_path(self, root):
+        """Returns .ingest_state-<name>-<hash of root>.jsonl, so each archive gets its own checkpoint."""
+        digest = hashlib.sha1(root.encode('utf-8')).hexdigest()[:12]
+        return f'.ingest_state-{os.path.basename(root) or "root"}-{digest}.jsonl'
+
+    def load_state(self, state_path, root):
+        """Returns the set of relative paths already recorded in the state file.
+
+        Raises:
+            CommandError: If the state file was written for a different root. Its relative
+                paths (grouper/IMG_0001.jpg) would otherwise skip unrelated files of this one.
+        """
+        done = set()
+        if os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as state:
+                for line in state:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue # a line cut short by a crash mid-write, that file is simply processed again
+                    if 'root' in record:
+                        if record['root'] != root:
+                            raise CommandError(
+                                f"{state_path} holds the progress of {record['root']}, not {root}; "
+                                'pass a different --state-file'
+                            )
+                    elif 'path' in record:
+                        done.add(record['path'])
+        return done
+
+    def walk(self, root, done, state_path):
+        """Yields (path, label) for every file under <root>/<label>/ that isn't in `done`."""
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+            relative_dir = os.path.relpath(dirpath, root)
+            if relative_dir == '.':
+                continue # files directly under root have no label
+            label = relative_dir.split(os.sep)[0]
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                if name.startswith('.') or path == state_path:
+                    continue
+                if os.path.relpath(path, root) not in done:
+                    yield path, label
+
+    def upload(self, root, path, label):
+        """Validates and uploads one file. Runs on a worker thread.
+
+        Returns a dict describing the result, with an 'error' key if the file was rejected.
+        """
+        relative_path = os.path.relpath(path, root)
+        try:
+            stat = os.stat(path)
+            # same file, same key: a rerun after a crash overwrites the object instead of orphaning it
+            key_id = uuid.uuid5(INGEST_KEY_NAMESPACE, f'{relative_path}:{stat.st_size}:{stat.st_mtime_ns}')
+            with open(path, 'rb') as file:
+                image_info = validate_image(file)
+                filename = self.storage_backend.upload_file(
+                    file, extension=image_info.extension, content_type=image_info.content_type, key_id=key_id
+                )
+        except (ImageValidationError, OSError) as e:
+            return {'path': relative_path, 'error': str(e)}
+        except Exception as e:
+            return {'path': relative_path, 'error': str(e), 'retry': True}
+        return {'path': relative_path, 'label': label, 'filename': filename, 'image_info': image_info}
+
+    def flush(self, results, state):
+        """Creates the SQL rows and DynamoDB items for a batch of uploads, then checkpoints it."""
+        uploaded = [result for result in results if 'error' not in result]
+        # rows may already exist if an earlier run crashed between bulk_create and its checkpoint
+        existing = set(
+            InventoryItem.objects.filter(filename__in=[result['filename'] for result in uploaded])
+            .values_list('filename', flat=True)
+        )
+        items = [
+            InventoryItem(label=result['label'], filename=result['filename'], user=self.user, **result['image_info'].as_metadata())
+            for result in uploaded if result['filename'] not in existing
+        ]
+        with transaction.atomic(): # splits and their counts are stored together with the rows
+            SplitCount.assign(items)
+            InventoryItem.objects.bulk_create(items)
+        try:
+            self.storage_backend.create_inventory_items([item.dynamodb_item() for item in items])
+        except Exception as e:
+            # the SQL rows are in, reconcile_storage --repair recreates the missing DynamoDB items
+            self.stderr.write(f'DynamoDB batch failed, run reconcile_storage --repair afterwards: {e}')
+
+        for result in results:
+            if 'error' in result:
+                self.failed += 1
+                self.stderr.write(f"{result['path']}: {result['error']}")
+                if result.get('retry'):
+                    continue # S3 or network error, leave it out of the checkpoint so the next run retries it
+                state.write(json.dumps({'path': result['path'], 'error': result['error']}) + '\n')
+            else:
+                self.bytes_uploaded += result['image_info'].byte_size
+                state.write(json.dumps({'path': result['path'], 'filename': result['filename']}) + '\n')
+        state.flush()
+        os.fsync(state.fileno())
+
+        self.created += len(items)
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        self.stdout.write(
+            f'{self.created} created, {self.failed} rejected | '
+            f'{self.created / elapsed:.1f} images/s, {self.bytes_uploaded / elapsed / 1024 / 1024:.1f} MB/s'
+        )
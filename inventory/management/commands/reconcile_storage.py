@@ -0,0 +1,193 @@
+"""
+Management command that reconciles inventory items across SQL, S3 and DynamoDB.
+
+The three stores are read concurrently: a parallel DynamoDB Scan (one thread per
+segment), S3 list_objects_v2 over images/ split into key ranges listed side by side,
+and the SQL table in chunks. Each source is spilled to hash-partitioned files and
+joined one partition at a time (see inventory/reconcile.py), so memory stays bounded
+with millions of objects.
+
+By default the command only reports. With --repair, SQL is treated as the source of truth:
+    - orphan S3 objects and DynamoDB items are deleted,
+    - missing DynamoDB items are recreated from the SQL rows,
+    - DynamoDB labels that differ from SQL are overwritten,
+    - SQL rows that never got a filename (the upload crashed) are deleted.
+SQL rows whose S3 object is gone are only reported.
+
+Records newer than --grace-minutes are skipped, they may belong to an upload in progress.
+boto3 reads AWS_ENDPOINT_URL, so the command can be pointed at local stand-ins
+(e.g. LocalStack or moto server) the same way as the rest of the app.
+
+Usage:
+    python manage.py reconcile_storage --segments 16 --s3-shards 16
+    python manage.py reconcile_storage --repair --output findings.jsonl
+"""
+import json
+import tempfile
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+
+from inventory.models import InventoryItem
+from inventory.reconcile import (
+    KINDS,
+    LABEL_MISMATCH,
+    MISSING_DYNAMODB,
+    MISSING_S3,
+    ORPHAN_DYNAMODB,
+    ORPHAN_S3,
+    PartitionedSpill,
+    iter_findings,
+    key_ranges,
+)
+from inventory.storage_backends import AWSStorageBackend
+
+SPILL_PAGE_SIZE = 1000 # records handed to a spill at once
+SQL_IN_BATCH_SIZE = 500 # filenames per IN (...) query, well under SQLite's bound parameter limit
+
+
+class Command(BaseCommand):
+    help = 'Reports (and optionally repairs) inventory items that are out of step between SQL, S3 and DynamoDB.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Fix what can be fixed instead of only reporting it.')
+        parser.add_argument('--segments', type=int, default=8, help='Parallel DynamoDB Scan segments.')
+        parser.add_argument('--s3-shards', type=int, default=16, help='Key ranges of images/ listed concurrently (at most 16).')
+        parser.add_argument('--partitions', type=int, default=64, help='Spill partitions; more partitions means less memory per join.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='SQL rows fetched per chunk.')
+        parser.add_argument('--grace-minutes', type=int, default=60, help='Ignore records newer than this.')
+        parser.add_argument('--prefix', default='images/', help='S3 prefix holding the inventory images.')
+        parser.add_argument('--workdir', default=None, help='Directory for the spill files (defaults to the system temp dir).')
+        parser.add_argument('--output', default=None, help='Write every finding to this file as JSON lines.')
+        parser.add_argument('--show', type=int, default=10, help='Examples printed per kind of finding.')
+
+    def handle(self, *args, **options):
+        storage_backend = AWSStorageBackend()
+        started = time.monotonic()
+        cutoff = time.time() - options['grace_minutes'] * 60
+
+        with tempfile.TemporaryDirectory(dir=options['workdir'], prefix='reconcile-') as workdir:
+            spills = {name: PartitionedSpill(workdir, name, options['partitions']) for name in ('sql', 'dynamodb', 's3')}
+            try:
+                ranges = key_ranges(options['prefix'], options['s3_shards'])
+                with ThreadPoolExecutor(max_workers=options['segments'] + len(ranges)) as executor:
+                    futures = [
+                        executor.submit(self.collect_dynamodb, storage_backend, spills['dynamodb'], segment, options['segments'])
+                        for segment in range(options['segments'])
+                    ]
+                    futures += [
+                        executor.submit(self.collect_s3, storage_backend, spills['s3'], options['prefix'], start_after, end_before)
+                        for start_after, end_before in ranges
+                    ]
+                    # SQL is read on this thread while the AWS listings run, so it keeps its usual DB connection
+                    self.collect_sql(spills['sql'], options['chunk_size'])
+                    for future in futures:
+                        future.result() # re-raise the first AWS error, if any
+            finally:
+                for spill in spills.values():
+                    spill.close()
+            self.stdout.write(
+                f"Collected {spills['sql'].count} SQL rows, {spills['dynamodb'].count} DynamoDB items and "
+                f"{spills['s3'].count} S3 objects in {time.monotonic() - started:.1f}s"
+            )
+
+            summary = Counter()
+            output = open(options['output'], 'w', encoding='utf-8') if options['output'] else None
+            try:
+                for findings in iter_findings(spills['sql'], spills['dynamodb'], spills['s3'], cutoff):
+                    for finding in findings:
+                        summary[finding.kind] += 1
+                        if summary[finding.kind] <= options['show']:
+                            self.stdout.write(f'  {finding.kind}: {finding.filename}')
+                        if output:
+                            output.write(json.dumps(finding._asdict()) + '\n')
+                    if options['repair'] and findings:
+                        self.repair(storage_backend, findings)
+            finally:
+                if output:
+                    output.close()
+
+        incomplete = InventoryItem.objects.filter(
+            filename='', timestamp__lt=datetime.fromtimestamp(cutoff, tz=timezone.utc)
+        )
+        if options['repair']:
+            summary['sql_without_filename'] = incomplete.delete()[0]
+        else:
+            summary['sql_without_filename'] = incomplete.count()
+
+        for kind in KINDS + ('sql_without_filename',):
+            self.stdout.write(f'Found {summary[kind]} {kind}')
+        if options['repair']:
+            self.stdout.write(f'Repaired everything except {MISSING_S3} (the images are gone, the rows are left for review)')
+        self.stdout.write(self.style.SUCCESS(f'Reconciliation finished in {time.monotonic() - started:.1f}s'))
+
+    def collect_sql(self, spill, chunk_size):
+        """Spills {filename: [label, created_epoch]} for every SQL row that has a filename."""
+        rows = (
+            InventoryItem.objects.exclude(filename='')
+            .values_list('filename', 'label', 'timestamp')
+            .iterator(chunk_size=chunk_size) # streams from a server-side cursor where the database supports one
+        )
+        page = []
+        for filename, label, timestamp in rows:
+            page.append((filename, [label, timestamp.timestamp()]))
+            if len(page) >= SPILL_PAGE_SIZE:
+                spill.add_many(page)
+                page = []
+        spill.add_many(page)
+
+    def collect_dynamodb(self, storage_backend, spill, segment, total_segments):
+        """Spills {filename: [label, created_epoch]} for one segment of the DynamoDB table."""
+        page = []
+        for filename, label, timestamp in storage_backend.scan_inventory_items(segment, total_segments):
+            page.append((filename, [label, self.parse_timestamp(timestamp)]))
+            if len(page) >= SPILL_PAGE_SIZE:
+                spill.add_many(page)
+                page = []
+        spill.add_many(page)
+
+    def parse_timestamp(self, value):
+        """Returns the epoch seconds of a stored ISO 8601 timestamp, or None if it's missing or unreadable."""
+        try:
+            created = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return None # items without a usable timestamp can't be in flight, upload_image always writes one
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+        return created.timestamp()
+
+    def collect_s3(self, storage_backend, spill, prefix, start_after, end_before):
+        """Spills {key: last_modified_epoch} for one key range of the S3 bucket."""
+        page = []
+        for key, last_modified in storage_backend.list_files(prefix, start_after, end_before):
+            page.append((key, last_modified.timestamp()))
+            if len(page) >= SPILL_PAGE_SIZE:
+                spill.add_many(page)
+                page = []
+        spill.add_many(page)
+
+    def repair(self, storage_backend, findings):
+        """Applies the repairs for one partition's findings with batched, parallel AWS calls."""
+        by_kind = defaultdict(list)
+        for finding in findings:
+            by_kind[finding.kind].append(finding)
+
+        if by_kind[ORPHAN_S3]:
+            storage_backend.delete_files([finding.filename for finding in by_kind[ORPHAN_S3]])
+        if by_kind[ORPHAN_DYNAMODB]:
+            storage_backend.delete_inventory_items([finding.filename for finding in by_kind[ORPHAN_DYNAMODB]])
+        if by_kind[MISSING_DYNAMODB]:
+            filenames = [finding.filename for finding in by_kind[MISSING_DYNAMODB]]
+            items = []
+            for i in range(0, len(filenames), SQL_IN_BATCH_SIZE):
+                items += InventoryItem.objects.filter(filename__in=filenames[i:i + SQL_IN_BATCH_SIZE])
+            storage_backend.create_inventory_items([item.dynamodb_item() for item in items])
+
+        labels = defaultdict(list)
+        for finding in by_kind[LABEL_MISMATCH]:
+            labels[finding.detail].append(finding.filename) # detail holds the SQL label
+        for label, filenames in labels.items():
+            storage_backend.update_inventory_items(filenames, {'label': label})
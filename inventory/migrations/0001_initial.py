@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SplitCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=255)),
+                ('split', models.CharField(choices=[('train', 'Train'), ('val', 'Validation'), ('test', 'Test')], max_length=5)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('label', 'split'), name='inventory_splitcount_label_split')],
+            },
+        ),
+        migrations.CreateModel(
+            name='InventoryItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=255)),
+                ('filename', models.CharField(max_length=255)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('width', models.PositiveIntegerField(blank=True, db_index=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, db_index=True, null=True)),
+                ('image_format', models.CharField(blank=True, db_index=True, max_length=10)),
+                ('byte_size', models.PositiveIntegerField(blank=True, db_index=True, null=True)),
+                ('captured_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('split', models.CharField(blank=True, choices=[('train', 'Train'), ('val', 'Validation'), ('test', 'Test')], max_length=5)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['width', 'height'], name='inventory_width_height_idx'), models.Index(fields=['split', 'label'], name='inventory_split_label_idx')],
+            },
+        ),
+    ]
@@ -1,6 +1,10 @@
 # model.py file for inventory app. 
-from django.db import models
+from collections import Counter, defaultdict
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User  # Import User model
+from .splits import SPLIT_CHOICES, choose_split
 from .storage_backends import AWSStorageBackend
 
 # Create your models here.
@@ -13,29 +17,128 @@ class InventoryItem(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True) # to automatically record the data and time of item creation. Although this is automated by using objects.create()
     user = models.ForeignKey(User, on_delete=models.CASCADE) # to associate the item with the user who uploaded it (once you implement user sign-in)
 
-    def upload_image(self, image):
+    # Image metadata captured from the header at ingest, so nobody has to re-download the original to ask about it.
+    # Null for items uploaded before it was captured until `manage.py backfill_image_metadata` has run.
+    width = models.PositiveIntegerField(null=True, blank=True, db_index=True) # displayed width in pixels (EXIF rotation applied)
+    height = models.PositiveIntegerField(null=True, blank=True, db_index=True) # displayed height in pixels (EXIF rotation applied)
+    image_format = models.CharField(max_length=10, blank=True, db_index=True) # Pillow format name, e.g. JPEG
+    byte_size = models.PositiveIntegerField(null=True, blank=True, db_index=True) # size of the stored S3 object
+    captured_at = models.DateTimeField(null=True, blank=True, db_index=True) # EXIF capture time, if the camera recorded one
+
+    # Train/val/test split, assigned once when the image is stored and never changed afterwards (see splits.py).
+    # Blank for items uploaded before splits existed until `manage.py assign_splits` has run.
+    split = models.CharField(max_length=5, choices=SPLIT_CHOICES, blank=True)
+
+    class Meta:
+        indexes = [
+            # resolution and orientation filters (e.g. width__gt=F('height')) are answered from this index
+            models.Index(fields=['width', 'height'], name='inventory_width_height_idx'),
+            # one split, or one label within a split, is a single range scan of this index
+            models.Index(fields=['split', 'label'], name='inventory_split_label_idx'),
+        ]
+
+    def upload_image(self, image, image_info=None):
         """
-        Uploads the image to S3, stores the filename, and creates a DynamoDB entry.
+        Uploads the image to S3, stores the filename and image metadata, and creates a DynamoDB entry.
 
         Args:
             image: The image file to be uploaded.
+            image_info: Optional ImageInfo from image_validation.validate_image. When given, the
+                stored extension and content type come from the real image format and the
+                metadata read from the header is saved along with the filename.
 
         Raises:
             Exception: If any errors occur during S3 or DynamoDB operations.
         """
         storage_backend = AWSStorageBackend() # creates instance of the storage backend class to interact with S3 and DynamoDB. 
-        filename = storage_backend.upload_file(image) # uploads the provided image to S3 and returns the generated filename
+        if image_info is not None:
+            filename = storage_backend.upload_file(image, extension=image_info.extension, content_type=image_info.content_type)
+        else:
+            filename = storage_backend.upload_file(image) # uploads the provided image to S3 and returns the generated filename
         self.filename = filename # stores the S3 filename in the model instance
-        self.save() # persists the updated model instance with the filename in the data base
+        if image_info is not None:
+            for field, value in image_info.as_metadata().items(): # metadata already read from the header during validation
+                setattr(self, field, value)
+        with transaction.atomic(): # the split and its count are stored together
+            SplitCount.assign([self]) # the split is derived from the S3 filename, so it can only be chosen now
+            self.save() # persists the updated model instance with the filename in the data base
 
-        # Create a dictionary to hold the item data for DynamoDB:
-        item_data = {
+        # Call the function to create the item in DynamoDB:
+        storage_backend.create_inventroy_item(self.dynamodb_item())
+
+    def dynamodb_item(self):
+        """
+        Returns the dictionary stored in DynamoDB for this item, keyed by its S3 filename.
+        """
+        return {
             'filename': self.filename, # Store the filename of the uploaded image in S3
             'label': self.label, # Store the assigned label for the inventory item
-            'timestamp': self.timestamp, # Might need to format the timestamp as a date string for DynamoDB
-            'user_id': self.user.id # Store the ID of the user who uploaded the item:
+            'timestamp': self.timestamp, # stored as an ISO 8601 string by storage_backends.serialize_item
+            'user_id': self.user_id, # Store the ID of the user who uploaded the item (user_id avoids loading the User row)
+            'width': self.width,
+            'height': self.height,
+            'image_format': self.image_format or None,
+            'byte_size': self.byte_size,
+            'captured_at': self.captured_at,
+            'split': self.split or None,
         }
-        # Call the function to create the item in DynamoDB:
-        storage_backend.create_inventory_item(item_data)
 
 
+class SplitCount(models.Model):
+    """
+    Number of inventory items per (label, split).
+
+    Lets split assignment stratify per label without counting InventoryItem rows, and answers
+    "how big is each split" with a single small query. Kept in step by SplitCount.assign and by
+    the admin's bulk relabel and delete actions.
+    """
+    label = models.CharField(max_length=255)
+    split = models.CharField(max_length=5, choices=SPLIT_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['label', 'split'], name='inventory_splitcount_label_split'),
+        ]
+
+    def __str__(self):
+        return f'{self.label} / {self.split}: {self.count}'
+
+    @classmethod
+    def assign(cls, items):
+        """
+        Gives every item that has no split yet a split, stratified per label, and updates the counts.
+
+        The items are not saved; call inside the same transaction that saves them.
+
+        Args:
+            items: InventoryItem instances with their label and filename set.
+        """
+        by_label = defaultdict(list)
+        for item in items:
+            if not item.split:
+                by_label[item.label].append(item)
+        if not by_label:
+            return # every item already has its split, which never changes
+        with transaction.atomic():
+            for label, label_items in by_label.items():
+                # select_for_update serializes concurrent assignments for the same label (where the database supports it)
+                counts = dict(cls.objects.select_for_update().filter(label=label).values_list('split', 'count'))
+                added = Counter()
+                for item in label_items:
+                    item.split = choose_split(item.filename, counts)
+                    counts[item.split] = counts.get(item.split, 0) + 1
+                    added[item.split] += 1
+                cls.add(label, added)
+
+    @classmethod
+    def add(cls, label, deltas):
+        """
+        Adds {split: delta} to the counts of one label; deltas may be negative.
+        """
+        for split, delta in deltas.items():
+            if not delta:
+                continue
+            count, created = cls.objects.get_or_create(label=label, split=split, defaults={'count': max(delta, 0)})
+            if not created:
+                cls.objects.filter(pk=count.pk).update(count=Greatest(F('count') + delta, 0))
@@ -0,0 +1,128 @@
+"""Three-way reconciliation of inventory images across SQL, S3 and DynamoDB.
+
+InventoryItem.upload_image writes the SQL row, the S3 object and the DynamoDB item
+one after the other, so a crash in between leaves a record in one store that the
+others don't know about. Reconciling means joining the three sets of filenames.
+
+To keep memory bounded however many objects there are, every source is first
+spilled to disk, hash-partitioned by filename into N files. The same filename
+always lands in the same partition, so each partition can then be joined on its
+own with plain dict lookups, holding only 1/N of the keys in memory at a time.
+
+Nothing in here talks to AWS or the database: the collectors in the
+reconcile_storage command feed the spills, which keeps the join testable with
+in-memory stand-ins.
+"""
+import json
+import os
+import threading
+import zlib
+from collections import namedtuple
+
+# Finding kinds
+MISSING_S3 = 'missing_s3' # SQL row whose image is not in S3 (can't be repaired, the image is gone)
+MISSING_DYNAMODB = 'missing_dynamodb' # SQL row with no DynamoDB item
+LABEL_MISMATCH = 'label_mismatch' # DynamoDB item whose label differs from the SQL row
+ORPHAN_S3 = 'orphan_s3' # S3 object with no SQL row
+ORPHAN_DYNAMODB = 'orphan_dynamodb' # DynamoDB item with no SQL row
+KINDS = (MISSING_S3, MISSING_DYNAMODB, LABEL_MISMATCH, ORPHAN_S3, ORPHAN_DYNAMODB)
+
+Finding = namedtuple('Finding', ['kind', 'filename', 'detail'])
+
+
+class PartitionedSpill:
+    """Spreads (filename, value) records over `partitions` files on disk by a hash of the filename.
+
+    add_many is thread-safe, so parallel collectors (DynamoDB scan segments, S3
+    listing shards) can all feed the same spill. Values must be JSON serializable.
+    """
+
+    def __init__(self, directory, name, partitions):
+        self.paths = [os.path.join(directory, f'{name}-{i:04d}.jsonl') for i in range(partitions)]
+        self._files = [open(path, 'w', encoding='utf-8') for path in self.paths]
+        self._lock = threading.Lock()
+        self.count = 0
+
+    @staticmethod
+    def partition_of(filename, partitions):
+        return zlib.crc32(filename.encode('utf-8')) % partitions
+
+    def add_many(self, records):
+        """Adds an iterable of (filename, value) pairs, typically one page from a paginated API."""
+        lines = [[] for _ in self._files]
+        for filename, value in records:
+            lines[self.partition_of(filename, len(self._files))].append(json.dumps([filename, value]) + '\n')
+        with self._lock: # one lock round-trip per page rather than per record
+            for file, partition_lines in zip(self._files, lines):
+                if partition_lines:
+                    file.writelines(partition_lines)
+                    self.count += len(partition_lines)
+
+    def close(self):
+        for file in self._files:
+            file.close()
+
+    def load(self, partition):
+        """Returns {filename: value} for one partition. Call after close()."""
+        with open(self.paths[partition], encoding='utf-8') as file:
+            return dict(json.loads(line) for line in file)
+
+
+def diff_partition(sql, dynamodb, s3, cutoff=None):
+    """Joins one partition of the three stores and yields a Finding per discrepancy.
+
+    Args:
+        sql: {filename: [label, created_epoch]} for the SQL rows.
+        dynamodb: {filename: [label, created_epoch]} for the DynamoDB items, created_epoch
+            being None when the item has no readable timestamp.
+        s3: {filename: last_modified_epoch} for the S3 objects.
+        cutoff: Optional epoch seconds. Records newer than this may belong to an upload
+            that is still in progress, so they are not reported as missing or orphaned.
+    """
+    for filename, (label, created) in sql.items():
+        in_flight = cutoff is not None and created > cutoff
+        if filename not in s3:
+            if not in_flight:
+                yield Finding(MISSING_S3, filename, label)
+        if filename not in dynamodb:
+            if not in_flight:
+                yield Finding(MISSING_DYNAMODB, filename, label)
+        elif dynamodb[filename][0] != label:
+            yield Finding(LABEL_MISMATCH, filename, label)
+    for filename, last_modified in s3.items():
+        if filename not in sql and (cutoff is None or last_modified <= cutoff):
+            yield Finding(ORPHAN_S3, filename, None)
+    for filename, (label, created) in dynamodb.items():
+        # The SQL row is written before the DynamoDB item, but with a blank filename until the S3
+        # upload is done. A row read during that window is not in `sql` while its DynamoDB item,
+        # written moments later, is in the scan, so recent items get the same grace period.
+        if filename not in sql and (cutoff is None or created is None or created <= cutoff):
+            yield Finding(ORPHAN_DYNAMODB, filename, label)
+
+
+def iter_findings(sql_spill, dynamodb_spill, s3_spill, cutoff=None):
+    """Yields the list of findings for each partition in turn, one partition in memory at a time."""
+    for partition in range(len(sql_spill.paths)):
+        yield list(diff_partition(
+            sql_spill.load(partition),
+            dynamodb_spill.load(partition),
+            s3_spill.load(partition),
+            cutoff,
+        ))
+
+
+def key_ranges(prefix, shards):
+    """Splits the keys under `prefix` into `shards` contiguous (start_after, end_before) ranges.
+
+    Upload keys are prefix + uuid4, so they are split on the first hex digit.
+    The first range is open at the start and the last at the end, so keys that
+    don't follow the uuid pattern are still listed by one of the shards (apart from
+    a key that is exactly prefix + one digit, which upload_file never produces,
+    since StartAfter is exclusive).
+    """
+    digits = '0123456789abcdef'
+    shards = max(1, min(shards, len(digits)))
+    bounds = [prefix + digits[i * len(digits) // shards] for i in range(1, shards)]
+    starts = [None] + bounds
+    ends = bounds + [None]
+    return list(zip(starts, ends))
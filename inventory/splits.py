@@ -0,0 +1,73 @@
+"""Deterministic, per-label stratified train/val/test split assignment.
+
+Every item gets its split once, when it is inserted, and keeps it: adding new images
+never moves an existing one to another split, so a model trained on last month's
+train split never sees this month's test images.
+
+The split comes from a stable hash of the item's S3 key (a uuid, unique per image):
+the hash maps to a number in [0, 1) and the split ratios cut that range into buckets.
+On its own that only hits the target ratios on average, which drifts badly for labels
+with few photos. So the choice is also stratified per label: when the hashed split is
+already over its share for that label, the item goes to the split that is furthest
+below its share instead. This keeps every label within about one item of the target
+ratios while staying deterministic for a given insertion order.
+
+This module holds the pure logic; SplitCount in inventory/models.py keeps the
+per-(label, split) counts and applies it to items.
+"""
+import hashlib
+
+from django.conf import settings
+
+TRAIN = 'train'
+VAL = 'val'
+TEST = 'test'
+SPLIT_CHOICES = [
+    (TRAIN, 'Train'),
+    (VAL, 'Validation'),
+    (TEST, 'Test'),
+]
+SPLIT_RATIOS = {TRAIN: 0.8, VAL: 0.1, TEST: 0.1}
+
+
+def split_ratios():
+    """Returns the configured {split: ratio}, INVENTORY_SPLIT_RATIOS overriding the defaults."""
+    return getattr(settings, 'INVENTORY_SPLIT_RATIOS', SPLIT_RATIOS)
+
+
+def stable_fraction(key):
+    """Maps a key to a number in [0, 1) that is the same on every machine and every run."""
+    digest = hashlib.sha256(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+
+def hashed_split(key, ratios=None):
+    """Returns the split a key falls into by hash alone."""
+    ratios = ratios or split_ratios()
+    fraction = stable_fraction(key)
+    cumulative = 0.0
+    for split, ratio in ratios.items():
+        cumulative += ratio
+        if fraction < cumulative:
+            return split
+    return split # rounding left the fraction past the last bucket
+
+
+def choose_split(key, counts, ratios=None):
+    """Picks the split for a new item of one label.
+
+    Args:
+        key: A stable identifier for the item (its S3 key).
+        counts: {split: number of items of this label already in it}.
+        ratios: Optional {split: ratio}, defaults to split_ratios().
+
+    Returns:
+        str: The split to store on the item.
+    """
+    ratios = ratios or split_ratios()
+    split = hashed_split(key, ratios)
+    total = sum(counts.get(name, 0) for name in ratios) + 1 # including the new item
+    # go with the hash unless it would push that split more than one item over its share for this label
+    if counts.get(split, 0) + 1 <= ratios[split] * total + 1:
+        return split
+    return max(ratios, key=lambda name: ratios[name] * total - counts.get(name, 0))
@@ -1,26 +1,92 @@
 import os
 import uuid
-from botocore.config import Config
-import boto3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+from CCWebApp.lazy_imports import boto3, botocore_config, dynamodb_types
+
+S3_DELETE_BATCH_SIZE = 1000 # most keys delete_objects accepts per call
+DYNAMODB_WRITE_BATCH_SIZE = 25 # most requests batch_write_item accepts per call
+MAX_WORKERS = 16 # parallel AWS calls made by the bulk methods
+
+
+@lru_cache(maxsize=None)
+def _type_serializer():
+    return dynamodb_types().TypeSerializer()
+
+
+def _chunks(items, size):
+    """Splits a list into consecutive chunks of at most `size` items."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def serialize_item(item_data):
+    """Converts a plain dict into the typed attribute format the low-level DynamoDB client expects.
+    - datetimes are stored as ISO 8601 strings, ints and floats as numbers.
+    - None values are left out rather than stored as NULL attributes.
+    """
+    serializer = _type_serializer()
+    item = {}
+    for key, value in item_data.items():
+        if value is None:
+            continue
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        elif isinstance(value, float):
+            value = Decimal(str(value)) # the serializer rejects floats
+        item[key] = serializer.serialize(value)
+    return item
+
+
 class AWSStorageBackend:
     """Handles interactions with AWS S3 and DynamoDB for image storage and metadata management."""   
     def __init__(self) -> None:
              """Initializes the S3 and DynamoDB clients using environment variables for credentials."""
-             self.s3_client = boto3.client('s3', config=Config(signature_version='s3v4'))
-             self.dynamodb_client = boto3.client('dynamodb')
+             # boto3 is imported here, on first use, rather than when the module loads (see CCWebApp/lazy_imports.py)
+             self.s3_client = boto3().client('s3', config=botocore_config().Config(signature_version='s3v4'))
+             self.dynamodb_client = boto3().client('dynamodb')
              
              # Set bucket and table names from environment variables
              self.bucket_name = os.environ['S3_BUCKET_NAME'] # user image bucket
              self.table_name = os.environ['DYNAMODB_TABLE_NAME'] # image label bucket
 
-    def upload_file(self, file):
-        """Uploads a file to S3 and returns the generated filename."""
-        filename = f'images/{uuid.uuid4()}{os.path.splitext(file.name)[1]}'
+    def upload_file(self, file, extension=None, content_type=None, key_id=None):
+        """Uploads a file to S3 and returns the generated filename.
+        - extension and content_type should come from the validated image format (see image_validation.validate_image).
+        - Falls back to the extension of file.name when no extension is given.
+        - key_id replaces the random uuid in the key, for callers that need retrying an upload to hit the same key.
+        """
+        if extension is None:
+            extension = os.path.splitext(file.name)[1]
+        filename = f'images/{key_id or uuid.uuid4()}{extension}'
+        extra_args = {'ContentType': content_type} if content_type else None
         try:
-            self.s3_client.upload_fileobj(file, self.bucket_name, filename)
+            self.s3_client.upload_fileobj(file, self.bucket_name, filename, ExtraArgs=extra_args)
             return filename
         except Exception as e:
             raise Exception(f'Error uploading file to S3: {e}')
+
+    def download_file(self, filename, fileobj):
+        """Streams an S3 object into the given writable binary file object."""
+        try:
+            self.s3_client.download_fileobj(self.bucket_name, filename, fileobj)
+        except Exception as e:
+            raise Exception(f'Error downloading file from S3: {e}')
+
+    def read_file_header(self, filename, length):
+        """Fetches only the first `length` bytes of an S3 object with a ranged GET.
+        - Returns a (data, total_size) tuple, total_size being the size of the whole object.
+        """
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=filename, Range=f'bytes=0-{length - 1}')
+            data = response['Body'].read()
+        except Exception as e:
+            raise Exception(f'Error reading file header from S3: {e}')
+        # ContentRange looks like 'bytes 0-65535/1234567', it is absent when the object is smaller than the range
+        content_range = response.get('ContentRange')
+        total_size = int(content_range.rsplit('/', 1)[1]) if content_range else len(data)
+        return data, total_size
     
     def create_inventroy_item(self, item_data):
         """Creates an item in the DynamoDB table with the provided data.
@@ -31,13 +97,125 @@ class AWSStorageBackend:
 
           """
         try:
-            self.dynamodb_client.put_item(TableName=self.table_name, Item=item_data) 
+            self.dynamodb_client.put_item(TableName=self.table_name, Item=serialize_item(item_data))
         except Exception as e:
             raise Exception(f'Error creating item in DynamoDB: {e}')
 
+    def update_inventory_item(self, filename, updates):
+        """Sets the given attributes on the DynamoDB item keyed by `filename`.
+        - Calls update_item with a SET expression, so attributes that aren't in `updates` are left alone.
+        - Attribute names go through ExpressionAttributeNames, some of ours (e.g. timestamp) are reserved words.
+        """
+        item = serialize_item(updates)
+        if not item:
+            return
+        names = {f'#a{i}': name for i, name in enumerate(item)}
+        values = {f':v{i}': value for i, value in enumerate(item.values())}
+        try:
+            self.dynamodb_client.update_item(
+                TableName=self.table_name,
+                Key=serialize_item({'filename': filename}),
+                UpdateExpression='SET ' + ', '.join(f'#a{i} = :v{i}' for i in range(len(item))),
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+            )
+        except Exception as e:
+            raise Exception(f'Error updating item in DynamoDB: {e}')
 
+    def update_inventory_items(self, filenames, updates, max_workers=MAX_WORKERS):
+        """Sets the same attributes on many DynamoDB items in parallel.
+        - DynamoDB has no batch update, so this fans update_item calls out over a thread pool.
+        - Raises the first error after all calls have finished.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.update_inventory_item, filename, updates) for filename in filenames]
+        errors = [future.exception() for future in futures if future.exception()]
+        if errors:
+            raise Exception(f'{len(errors)} of {len(filenames)} DynamoDB updates failed, first error: {errors[0]}')
 
+    def _batch_write(self, write_requests, max_workers):
+        """Sends DynamoDB write requests with parallel batch_write_item calls of 25 requests each.
+        - Unprocessed requests (throttling) are resubmitted until DynamoDB has accepted all of them.
+        """
+        def write_batch(batch):
+            request_items = {self.table_name: batch}
+            while request_items:
+                response = self.dynamodb_client.batch_write_item(RequestItems=request_items)
+                request_items = response.get('UnprocessedItems')
 
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(write_batch, _chunks(list(write_requests), DYNAMODB_WRITE_BATCH_SIZE)))
 
+    def create_inventory_items(self, items, max_workers=MAX_WORKERS):
+        """Creates (or overwrites) many DynamoDB items with batched, parallel writes.
+        - items is a list of dictionaries like the one passed to create_inventroy_item.
+        """
+        try:
+            self._batch_write([{'PutRequest': {'Item': serialize_item(item_data)}} for item_data in items], max_workers)
+        except Exception as e:
+            raise Exception(f'Error creating items in DynamoDB: {e}')
 
+    def delete_inventory_items(self, filenames, max_workers=MAX_WORKERS):
+        """Deletes many DynamoDB items with batched, parallel writes."""
+        try:
+            self._batch_write(
+                [{'DeleteRequest': {'Key': serialize_item({'filename': filename})}} for filename in filenames],
+                max_workers,
+            )
+        except Exception as e:
+            raise Exception(f'Error deleting items from DynamoDB: {e}')
 
+    def scan_inventory_items(self, segment=0, total_segments=1):
+        """Yields (filename, label, timestamp) for every DynamoDB item in one segment of a parallel Scan.
+        - Run one generator per segment, each in its own thread, to scan the table in parallel.
+        - Only these three attributes are projected, which keeps the read capacity used per item low.
+        - timestamp is the stored ISO 8601 string, or None for an item written without one.
+        """
+        paginator = self.dynamodb_client.get_paginator('scan')
+        pages = paginator.paginate(
+            TableName=self.table_name,
+            Segment=segment,
+            TotalSegments=total_segments,
+            ProjectionExpression='#f, #l, #t',
+            ExpressionAttributeNames={'#f': 'filename', '#l': 'label', '#t': 'timestamp'},
+        )
+        try:
+            for page in pages:
+                for item in page['Items']:
+                    yield item['filename']['S'], item.get('label', {}).get('S', ''), item.get('timestamp', {}).get('S')
+        except Exception as e:
+            raise Exception(f'Error scanning DynamoDB: {e}')
+
+    def list_files(self, prefix='images/', start_after=None, end_before=None):
+        """Yields (key, last_modified) for the S3 objects under `prefix`, in key order.
+        - start_after and end_before restrict the listing to one key range, so several ranges can be listed concurrently.
+        """
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        params = {'Bucket': self.bucket_name, 'Prefix': prefix}
+        if start_after:
+            params['StartAfter'] = start_after
+        try:
+            for page in paginator.paginate(**params):
+                for obj in page.get('Contents', []):
+                    if end_before is not None and obj['Key'] >= end_before:
+                        return
+                    yield obj['Key'], obj['LastModified']
+        except Exception as e:
+            raise Exception(f'Error listing files in S3: {e}')
+
+    def delete_files(self, filenames, max_workers=MAX_WORKERS):
+        """Deletes many S3 objects with parallel delete_objects calls of up to 1000 keys each."""
+        def delete_batch(batch):
+            response = self.s3_client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={'Objects': [{'Key': filename} for filename in batch], 'Quiet': True},
+            )
+            if response.get('Errors'):
+                error = response['Errors'][0]
+                raise Exception(f"{len(response['Errors'])} objects not deleted, first: {error['Key']}: {error['Message']}")
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(delete_batch, _chunks(list(filenames), S3_DELETE_BATCH_SIZE)))
+        except Exception as e:
+            raise Exception(f'Error deleting files from S3: {e}')
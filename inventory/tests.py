@@ -1,3 +1,790 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.core.management.base import CommandError
+from django.template import TemplateDoesNotExist
+from django.template.loader import render_to_string
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from CCWebApp.context_processors import template_version
+from CCWebApp.importtime import IMPORT_TIME_BUDGET_MS, ImportReport, measure, parse_importtime
+from CCWebApp.lazy_imports import pil_image
+from CCWebApp.static_storage import CompressedManifestStaticFilesStorage
+from .image_cache import STALE_TEMP_SECONDS, LocalImageCache
+from .image_validation import EXIF_DATETIME_ORIGINAL, EXIF_IFD, EXIF_ORIENTATION, inspect_image_header
+from .management.commands.ingest_images import Command as IngestImagesCommand
+from .models import InventoryItem, SplitCount
+from .reconcile import (
+    LABEL_MISMATCH,
+    MISSING_DYNAMODB,
+    MISSING_S3,
+    ORPHAN_DYNAMODB,
+    ORPHAN_S3,
+    PartitionedSpill,
+    diff_partition,
+    iter_findings,
+    key_ranges,
+)
+from .splits import SPLIT_RATIOS, TEST, TRAIN, VAL, choose_split
+from .views import IMAGE_CACHE_CONTROL
+from users.fragment_cache import NAV_FRAGMENT, invalidate_nav
 
 # Create your tests here.
+
+def encode_image(image_format, size=(16, 16)):
+    """Returns the bytes of a small solid image in the given Pillow format."""
+    buffer = io.BytesIO()
+    pil_image().new('RGB', size, 'white').save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class UserTestCase(TestCase):
+    """TestCase whose MEDIA_ROOT holds the default profile picture, which saving a new User resizes."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        media_root = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(media_root.cleanup)
+        with open(os.path.join(media_root.name, 'default.jpg'), 'wb') as file:
+            file.write(encode_image('JPEG'))
+        overrides = override_settings(MEDIA_ROOT=media_root.name)
+        overrides.enable()
+        cls.addClassCleanup(overrides.disable)
+
+
+class ImportTimeParserTests(SimpleTestCase):
+    """parse_importtime reads the stderr format of python -X importtime."""
+
+    SAMPLE = (
+        'import time: self [us] | cumulative | imported package\n'
+        'import time:       100 |        100 |     zlib\n'
+        'import time:       200 |        300 |   inventory.reconcile\n'
+        'import time:        50 |        350 | inventory\n'
+        'import time:        40 |         40 | PIL\n'
+    )
+
+    def test_parses_records_and_depth(self):
+        records = parse_importtime(self.SAMPLE)
+        self.assertEqual([record.module for record in records], ['zlib', 'inventory.reconcile', 'inventory', 'PIL'])
+        self.assertEqual([record.depth for record in records], [2, 1, 0, 0])
+
+    def test_total_counts_top_level_imports_once(self):
+        report = ImportReport(parse_importtime(self.SAMPLE))
+        self.assertEqual(report.total_ms, 0.39)
+        self.assertEqual(report.heavy_modules(), ['PIL'])
+
+
+class BootImportBudgetTests(SimpleTestCase):
+    """
+    Booting the project must stay fast: boto3/botocore and Pillow are loaded on first use
+    (CCWebApp/lazy_imports.py), never while Django starts up.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.report = measure()
+
+    def test_boot_does_not_import_heavy_dependencies(self):
+        self.assertEqual(self.report.heavy_modules(), [], self.report.format())
+
+    def test_boot_import_time_within_budget(self):
+        self.assertLessEqual(self.report.total_ms, IMPORT_TIME_BUDGET_MS, self.report.format())
+
+
+class ImageHeaderTests(SimpleTestCase):
+    """inspect_image_header reads everything it needs from a prefix of the file."""
+
+    def encode(self, image_format, size, **params):
+        Image = pil_image()
+        image = Image.effect_noise(size, 64).convert('RGB') # noise barely compresses, so the file is large
+        buffer = io.BytesIO()
+        image.save(buffer, image_format, **params)
+        return buffer.getvalue()
+
+    def test_png_prefix_is_enough(self):
+        data = self.encode('PNG', (1200, 800))
+        image_format, width, height, captured_at = inspect_image_header(io.BytesIO(data[:4096]))
+        self.assertEqual((image_format, width, height, captured_at), ('PNG', 1200, 800, None))
+
+    def test_jpeg_exif_rotation_and_capture_time(self):
+        exif = pil_image().Exif()
+        exif[EXIF_ORIENTATION] = 6 # rotated 90 degrees
+        exif.get_ifd(EXIF_IFD)[EXIF_DATETIME_ORIGINAL] = '2023:05:04 10:20:30'
+        data = self.encode('JPEG', (1200, 800), exif=exif.tobytes())
+        image_format, width, height, captured_at = inspect_image_header(io.BytesIO(data[:4096]))
+        self.assertEqual((image_format, width, height), ('JPEG', 800, 1200))
+        self.assertEqual(captured_at.isoformat(), '2023-05-04T10:20:30+00:00')
+
+
+class FakeStorageBackend:
+    """Stands in for AWSStorageBackend: serves `data` (or `size` bytes) per key and counts the downloads."""
+
+    def __init__(self, size=100, data=None):
+        self.data = b'x' * size if data is None else data
+        self.error = None
+        self.downloads = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def download_file(self, key, file):
+        self.release.wait(5)
+        self.downloads.append(key)
+        if self.error is not None:
+            raise self.error
+        file.write(self.data)
+
+
+class LocalImageCacheTests(SimpleTestCase):
+    """LocalImageCache keeps its whole directory within budget, least recently used out first."""
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.backend = FakeStorageBackend()
+
+    def make_cache(self, max_bytes=250):
+        return LocalImageCache(self.root.name, max_bytes, storage_backend=self.backend)
+
+    def read(self, cache, key):
+        file, size = cache.open(key)
+        with file:
+            return file.read(), size
+
+    def cached_keys(self):
+        return sorted(name for name in os.listdir(self.root.name) if not name.startswith('.'))
+
+    def test_hit_does_not_download_again(self):
+        cache = self.make_cache()
+        self.assertEqual(self.read(cache, 'a'), (b'x' * 100, 100))
+        self.read(cache, 'a')
+        self.assertEqual(self.backend.downloads, ['a'])
+
+    def test_least_recently_used_is_evicted(self):
+        cache = self.make_cache()
+        self.read(cache, 'a')
+        self.read(cache, 'b')
+        self.read(cache, 'a') # b is now the least recently used
+        self.read(cache, 'c')
+        self.assertEqual(self.cached_keys(), ['a', 'c'])
+        self.assertEqual(cache.total_bytes, 200)
+
+    def test_budget_is_shared_by_caches_on_one_directory(self):
+        first, second = self.make_cache(), self.make_cache() # two worker processes
+        self.read(first, 'a')
+        self.read(second, 'b')
+        self.read(first, 'c')
+        self.assertEqual(self.cached_keys(), ['b', 'c'])
+        self.read(second, 'c') # fetched by the other cache, a hit here
+        self.assertEqual(self.backend.downloads, ['a', 'b', 'c'])
+
+    def test_directory_is_scanned_only_when_the_budget_is_crossed(self):
+        cache = self.make_cache(max_bytes=1000)
+        with mock.patch.object(LocalImageCache, '_evict', autospec=True, side_effect=LocalImageCache._evict) as evict:
+            for key in 'abcdefghij': # 1000 bytes, exactly the budget
+                self.read(cache, key)
+            self.assertEqual(evict.call_count, 0)
+            self.read(cache, 'k')
+            self.assertEqual(evict.call_count, 1)
+        self.assertEqual(cache.total_bytes, 900) # evicted down to the low-water mark
+        self.assertEqual(self.make_cache(max_bytes=1000).total_bytes, 900) # the total is shared through the directory
+
+    def test_single_oversized_entry_is_served_then_evicted(self):
+        cache = self.make_cache(max_bytes=50)
+        self.assertEqual(self.read(cache, 'a'), (b'x' * 100, 100))
+        self.assertEqual(self.cached_keys(), ['a'])
+        self.read(cache, 'b')
+        self.assertEqual(self.cached_keys(), ['b'])
+
+    def test_concurrent_misses_are_coalesced(self):
+        cache = self.make_cache()
+        self.backend.release.clear()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.read(cache, 'a'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1) # let every thread reach the miss
+        self.backend.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.backend.downloads, ['a'])
+        self.assertEqual(results, [(b'x' * 100, 100)] * 8)
+
+    def test_stale_temp_files_are_removed_at_startup(self):
+        stale = os.path.join(self.root.name, '.tmp-stale')
+        fresh = os.path.join(self.root.name, '.tmp-fresh')
+        for path in (stale, fresh):
+            with open(path, 'wb') as file:
+                file.write(b'partial')
+        old = time.time() - STALE_TEMP_SECONDS - 60
+        os.utime(stale, (old, old))
+        self.make_cache()
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(fresh)) # may still be written by a live process
+
+
+class InMemorySpill:
+    """Stands in for PartitionedSpill, partitioning the same way but keeping the records in dicts."""
+
+    def __init__(self, records, partitions=4):
+        self.paths = [None] * partitions
+        self.partitions = [{} for _ in range(partitions)]
+        for filename, value in records.items():
+            self.partitions[PartitionedSpill.partition_of(filename, partitions)][filename] = value
+
+    def load(self, partition):
+        return self.partitions[partition]
+
+
+class ReconcileTests(SimpleTestCase):
+    """diff_partition and iter_findings join the three stores; recent records get a grace period."""
+
+    OLD, CUTOFF, NEW = 100.0, 200.0, 300.0
+
+    def stores(self, created):
+        sql = {
+            'images/ok': ['salmon', created],
+            'images/no-s3': ['salmon', created],
+            'images/no-dynamodb': ['salmon', created],
+            'images/relabeled': ['trout', created],
+        }
+        dynamodb = {
+            'images/ok': ['salmon', created],
+            'images/no-s3': ['salmon', created],
+            'images/relabeled': ['salmon', created],
+            'images/orphan-dynamodb': ['crab', created],
+        }
+        s3 = {'images/ok': created, 'images/no-dynamodb': created, 'images/relabeled': created, 'images/orphan-s3': created}
+        return sql, dynamodb, s3
+
+    def findings(self, sql, dynamodb, s3, cutoff):
+        batches = iter_findings(InMemorySpill(sql), InMemorySpill(dynamodb), InMemorySpill(s3), cutoff)
+        return sorted((finding.kind, finding.filename, finding.detail) for findings in batches for finding in findings)
+
+    def test_every_kind_is_found(self):
+        self.assertEqual(self.findings(*self.stores(self.OLD), cutoff=self.CUTOFF), [
+            (LABEL_MISMATCH, 'images/relabeled', 'trout'),
+            (MISSING_DYNAMODB, 'images/no-dynamodb', 'salmon'),
+            (MISSING_S3, 'images/no-s3', 'salmon'),
+            (ORPHAN_DYNAMODB, 'images/orphan-dynamodb', 'crab'),
+            (ORPHAN_S3, 'images/orphan-s3', None),
+        ])
+
+    def test_records_newer_than_cutoff_are_skipped(self):
+        # a label mismatch is not a race, it is reported whatever the age
+        self.assertEqual(self.findings(*self.stores(self.NEW), cutoff=self.CUTOFF), [
+            (LABEL_MISMATCH, 'images/relabeled', 'trout'),
+        ])
+
+    def test_no_cutoff_reports_everything(self):
+        self.assertEqual(len(self.findings(*self.stores(self.NEW), cutoff=None)), 5)
+
+    def test_dynamodb_item_without_timestamp_is_an_orphan(self):
+        findings = list(diff_partition({}, {'images/a': ['crab', None]}, {}, cutoff=self.CUTOFF))
+        self.assertEqual([finding.kind for finding in findings], [ORPHAN_DYNAMODB])
+
+    def test_key_ranges_bounds(self):
+        self.assertEqual(key_ranges('images/', 1), [(None, None)])
+        self.assertEqual(key_ranges('images/', 4), [
+            (None, 'images/4'), ('images/4', 'images/8'), ('images/8', 'images/c'), ('images/c', None),
+        ])
+        self.assertEqual(len(key_ranges('images/', 64)), 16) # at most one range per leading hex digit
+
+    def test_key_ranges_cover_every_key_once(self):
+        keys = [f'images/{digit}0f3e2a1-uuid.jpg' for digit in '0123456789abcdef'] + ['images/', 'images/zzz', 'images/-x']
+        for shards in (1, 3, 5, 16):
+            ranges = key_ranges('images/', shards)
+            for key in keys:
+                containing = [
+                    (start, end) for start, end in ranges
+                    if (start is None or key > start) and (end is None or key < end)
+                ]
+                self.assertEqual(len(containing), 1, (shards, key, containing))
+
+
+class FakeUploadBackend:
+    """Stands in for AWSStorageBackend.upload_file, recording the keys it was asked to use."""
+
+    def __init__(self):
+        self.keys = []
+
+    def upload_file(self, file, extension=None, content_type=None, key_id=None):
+        self.keys.append(key_id)
+        return f'images/{key_id}{extension}'
+
+
+class IngestImagesTests(SimpleTestCase):
+    """ingest_images resumes from its state file and gives a file the same S3 key on every run."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, 'photos')
+        os.makedirs(os.path.join(self.root, 'grouper'))
+        self.command = IngestImagesCommand()
+
+    def write(self, relative_path, data):
+        with open(os.path.join(self.root, relative_path), 'wb') as file:
+            file.write(data)
+
+    def write_state(self, *records):
+        path = os.path.join(self.tmp.name, 'state.jsonl')
+        with open(path, 'w', encoding='utf-8') as state:
+            state.writelines(json.dumps(record) + '\n' for record in records)
+            state.write('{"path": "grouper/cut-sh') # cut short by a crash
+        return path
+
+    def test_default_state_file_is_per_root(self):
+        first = self.command.default_state_path('/photos/2019')
+        self.assertNotEqual(first, self.command.default_state_path('/photos/2020'))
+        self.assertEqual(first, self.command.default_state_path('/photos/2019'))
+
+    def test_resume_skips_recorded_files(self):
+        for name in ('IMG_0001.jpg', 'IMG_0002.jpg'):
+            self.write(os.path.join('grouper', name), b'')
+        self.write('unlabeled.jpg', b'')
+        state_path = self.write_state({'root': self.root}, {'path': os.path.join('grouper', 'IMG_0001.jpg'), 'filename': 'images/x.jpg'})
+        done = self.command.load_state(state_path, self.root)
+        walked = [os.path.relpath(path, self.root) for path, label in self.command.walk(self.root, done, state_path)]
+        self.assertEqual(walked, [os.path.join('grouper', 'IMG_0002.jpg')])
+
+    def test_state_of_another_root_is_refused(self):
+        state_path = self.write_state({'root': '/photos/2019'}, {'path': 'grouper/IMG_0001.jpg'})
+        with self.assertRaises(CommandError):
+            self.command.load_state(state_path, self.root)
+
+    def test_same_file_gets_same_key(self):
+        buffer = io.BytesIO()
+        pil_image().new('RGB', (8, 8)).save(buffer, 'PNG')
+        self.write(os.path.join('grouper', 'a.png'), buffer.getvalue())
+        self.write(os.path.join('grouper', 'b.png'), b'not an image')
+        self.command.storage_backend = FakeUploadBackend()
+        path = os.path.join(self.root, 'grouper', 'a.png')
+        first = self.command.upload(self.root, path, 'grouper')
+        second = self.command.upload(self.root, path, 'grouper')
+        self.assertEqual(first['filename'], second['filename'])
+        self.assertTrue(first['filename'].endswith('.png'))
+        rejected = self.command.upload(self.root, os.path.join(self.root, 'grouper', 'b.png'), 'grouper')
+        self.assertIn('error', rejected)
+        self.assertNotIn('retry', rejected) # invalid files are checkpointed, not retried
+
+
+class ChooseSplitTests(SimpleTestCase):
+    """choose_split keeps every label close to the target ratios, even with only a few items."""
+
+    def assign(self, label, n):
+        counts, splits = {}, []
+        for i in range(n):
+            split = choose_split(f'images/{label}-{i}.jpg', counts, SPLIT_RATIOS)
+            counts[split] = counts.get(split, 0) + 1
+            splits.append(split)
+        return splits
+
+    def test_small_labels_stay_within_one_item_of_target(self):
+        for label in ('grouper', 'salmon', 'crab', 'squid'):
+            splits = self.assign(label, 40)
+            for total in range(1, len(splits) + 1):
+                for split, ratio in SPLIT_RATIOS.items():
+                    self.assertLessEqual(splits[:total].count(split), ratio * total + 1, (label, total, split))
+
+    def test_every_split_is_used_by_a_label_of_ten(self):
+        self.assertEqual(set(self.assign('mussels', 10)), {TRAIN, VAL, TEST})
+
+    def test_assignment_is_deterministic(self):
+        self.assertEqual(self.assign('trout', 25), self.assign('trout', 25))
+
+    def test_existing_items_keep_their_split(self):
+        items = [InventoryItem(label='trout', filename=f'images/{i}.jpg', split=VAL) for i in range(3)]
+        SplitCount.assign(items) # nothing to assign, so no counts are read or written either
+        self.assertEqual([item.split for item in items], [VAL] * 3)
+
+
+class StaticStorageTests(SimpleTestCase):
+    """Without collectstatic, {% static %} falls back to the unhashed name instead of failing the page."""
+
+    def test_url_without_manifest(self):
+        with tempfile.TemporaryDirectory() as root:
+            storage = CompressedManifestStaticFilesStorage(location=root, base_url='/static/')
+            self.assertEqual(storage.url('inventory/main.css'), '/static/inventory/main.css')
+
+
+class NavFragmentCacheTests(SimpleTestCase):
+    """The cached navigation bar is shared by every worker process, and so is its invalidation."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        cache_settings = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.tmp.name}}
+        overrides = override_settings(CACHES=cache_settings)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(caches['default'].close)
+
+    def render(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return render_to_string('home.html', request=request)
+
+    def test_invalidation_reaches_other_processes(self):
+        user = User(pk=5, username='before')
+        self.assertIn('before', self.render(user))
+        other_worker = FileBasedCache(self.tmp.name, {}) # a separate process reading the same cache
+        key = make_template_fragment_key(NAV_FRAGMENT, [template_version(), user.pk])
+        self.assertIn('before', other_worker.get(key))
+
+        user.username = 'after'
+        self.assertIn('before', self.render(user)) # served from the cache until invalidated
+        invalidate_nav(user.pk)
+        self.assertIsNone(other_worker.get(key))
+        self.assertIn('after', self.render(user))
+
+    def test_new_release_ignores_old_fragments(self):
+        user = User(pk=5, username='before')
+        self.render(user)
+        user.username = 'after'
+        with mock.patch('CCWebApp.context_processors.template_version', return_value='next-release'), \
+                mock.patch('users.forms.template_version', return_value='next-release'):
+            self.assertIn('after', self.render(user)) # different templates, different key
+
+    def test_bench_reports_pages_that_fail(self):
+        out = io.StringIO()
+        failing = {'users/login.html': TemplateDoesNotExist('bootstrap4/uni_form.html')}
+        def render(template_name, *args, **kwargs):
+            if template_name in failing:
+                raise failing[template_name]
+            return ''
+        with mock.patch('inventory.management.commands.bench_templates.render_to_string', side_effect=render):
+            with self.assertRaisesMessage(CommandError, '1 of 5 pages failed to render: users/login.html'):
+                call_command('bench_templates', iterations=2, stdout=out)
+        self.assertIn('TemplateDoesNotExist: bootstrap4/uni_form.html', out.getvalue())
+        self.assertIn('users/profile.html', out.getvalue()) # later pages still ran
+
+
+@mock.patch('inventory.models.AWSStorageBackend')
+class UploadImageViewTests(UserTestCase):
+    """Rejected uploads never create an InventoryItem and never reach S3 or DynamoDB."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('uploader', password='p')
+        self.client.force_login(self.user)
+
+    def post(self, data, name='photo.png'):
+        return self.client.post('/inventory/', {'label': 'salmon', 'image': SimpleUploadedFile(name, data)})
+
+    def assertRejected(self, response, status_code, backend):
+        self.assertEqual(response.status_code, status_code, response.content)
+        self.assertFalse(InventoryItem.objects.exists())
+        backend.assert_not_called()
+
+    @override_settings(INVENTORY_MAX_IMAGE_BYTES=100)
+    def test_too_many_bytes(self, backend):
+        self.assertRejected(self.post(encode_image('PNG', (64, 64)) + b'\0' * 100), 413, backend)
+
+    @override_settings(INVENTORY_MAX_IMAGE_PIXELS=100)
+    def test_too_many_pixels(self, backend):
+        self.assertRejected(self.post(encode_image('PNG', (20, 20))), 413, backend)
+
+    def test_decompression_bomb(self, backend):
+        with mock.patch.object(pil_image(), 'MAX_IMAGE_PIXELS', 100): # 400 pixels is over twice Pillow's limit
+            self.assertRejected(self.post(encode_image('PNG', (20, 20))), 413, backend)
+
+    def test_disallowed_format(self, backend):
+        self.assertRejected(self.post(encode_image('GIF'), name='photo.gif'), 400, backend)
+
+    def test_not_an_image(self, backend):
+        self.assertRejected(self.post(b'definitely not an image'), 400, backend)
+
+    def test_accepted_image_is_stored(self, backend):
+        backend.return_value.upload_file.return_value = 'images/abc.png'
+        response = self.post(encode_image('PNG', (20, 10)), name='photo.jpg') # the name lies, the header decides
+        self.assertEqual(response.status_code, 200, response.content)
+        item = InventoryItem.objects.get()
+        self.assertEqual((item.filename, item.width, item.height, item.image_format), ('images/abc.png', 20, 10, 'PNG'))
+        self.assertEqual(backend.return_value.upload_file.call_args.kwargs['extension'], '.png')
+        backend.return_value.create_inventroy_item.assert_called_once()
+
+
+class BackfillImageMetadataTests(UserTestCase):
+    """backfill_image_metadata fills SQL only once DynamoDB has the metadata too."""
+
+    def setUp(self):
+        user = User.objects.create_user('owner')
+        self.good = InventoryItem.objects.create(label='salmon', filename='images/good.png', user=user)
+        self.stuck = InventoryItem.objects.create(label='salmon', filename='images/stuck.png', user=user)
+        data = encode_image('PNG', (30, 20))
+        self.backend = mock.Mock()
+        self.backend.read_file_header.return_value = (data, len(data))
+        self.backend.update_inventory_item.side_effect = self.update_inventory_item
+
+    def update_inventory_item(self, filename, metadata):
+        if filename == 'images/stuck.png':
+            raise Exception('throttled')
+
+    def test_dynamodb_failure_is_counted_and_left_for_the_next_run(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with mock.patch('inventory.management.commands.backfill_image_metadata.AWSStorageBackend', return_value=self.backend):
+            call_command('backfill_image_metadata', stdout=stdout, stderr=stderr)
+        self.good.refresh_from_db()
+        self.stuck.refresh_from_db()
+        self.assertEqual((self.good.width, self.good.height, self.good.image_format), (30, 20, 'PNG'))
+        self.assertIsNone(self.stuck.width) # still pending, so a rerun retries it
+        self.assertIn('1 items updated, 0 unreadable, 1 DynamoDB updates failed', stdout.getvalue())
+        self.assertIn('images/stuck.png: DynamoDB update failed', stderr.getvalue())
+
+
+class ServeImageViewTests(UserTestCase):
+    """serve_image answers from the local cache, with ETags and long-lived private caching."""
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='p')
+        self.item = InventoryItem.objects.create(label='salmon', filename='images/abc.png', user=self.owner)
+        self.png = encode_image('PNG', (400, 300))
+        self.backend = FakeStorageBackend(data=self.png)
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        patcher = mock.patch('inventory.views.get_image_cache', return_value=LocalImageCache(root.name, 10 ** 6, self.backend))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.url = f'/inventory/images/{self.item.pk}/'
+
+    def get(self, user=None, **kwargs):
+        if user is not None:
+            self.client.force_login(user)
+        return self.client.get(self.url, **kwargs)
+
+    def test_owner_gets_the_image(self):
+        response = self.get(self.owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.png)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Cache-Control'], IMAGE_CACHE_CONTROL)
+        self.assertTrue(response['ETag'])
+
+    def test_thumbnail_is_a_small_jpeg(self):
+        response = self.get(self.owner, data={'thumbnail': '1'})
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        with pil_image().open(io.BytesIO(b''.join(response.streaming_content))) as thumb:
+            self.assertEqual((thumb.format, thumb.size), ('JPEG', (256, 192)))
+        self.assertNotEqual(response['ETag'], self.get()['ETag']) # the original has an ETag of its own
+
+    def test_matching_etag_is_not_modified_without_touching_the_cache(self):
+        etag = self.get(self.owner)['ETag']
+        self.backend.downloads.clear()
+        for if_none_match in (etag, f'"other", {etag}', '*'):
+            response = self.get(HTTP_IF_NONE_MATCH=if_none_match)
+            self.assertEqual(response.status_code, 304, if_none_match)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response['Cache-Control'], IMAGE_CACHE_CONTROL)
+        self.assertEqual(self.backend.downloads, [])
+
+    def test_anonymous_user_is_refused(self):
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_only_the_owner_and_staff_see_an_image(self):
+        self.assertEqual(self.get(User.objects.create_user('other')).status_code, 404)
+        self.assertEqual(self.get(User.objects.create_user('staff', is_staff=True)).status_code, 200)
+
+    def test_backend_error_is_not_leaked(self):
+        self.backend.error = Exception('NoSuchKey: bucket secret-bucket, key images/abc.png')
+        with self.assertLogs('inventory.views', 'ERROR'):
+            response = self.get(self.owner)
+        self.assertEqual(response.status_code, 502)
+        self.assertNotIn(b'secret-bucket', response.content)
+
+
+@mock.patch('inventory.admin.AWSStorageBackend')
+class InventoryItemAdminTests(UserTestCase):
+    """Bulk relabel and delete touch SQL once and fan out only the selected items to DynamoDB and S3."""
+
+    changelist_url = '/admin/inventory/inventoryitem/'
+
+    def setUp(self):
+        owner = User.objects.create_user('owner')
+        self.items = [
+            InventoryItem.objects.create(label='salmon', filename=f'images/{i}.jpg', user=owner, split=TRAIN if i < 3 else VAL)
+            for i in range(4)
+        ]
+        SplitCount.objects.create(label='salmon', split=TRAIN, count=3)
+        SplitCount.objects.create(label='salmon', split=VAL, count=1)
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'p')
+        self.client.force_login(self.admin)
+
+    def counts(self):
+        return sorted(SplitCount.objects.filter(count__gt=0).values_list('label', 'split', 'count'))
+
+    def post_action(self, action, items, **data):
+        return self.client.post(self.changelist_url, {'action': action, '_selected_action': [item.pk for item in items], **data})
+
+    def test_relabel_is_one_update_and_moves_the_counts(self, backend):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_action('relabel_selected', self.items[1:], new_label='trout')
+        self.assertEqual(response.status_code, 302)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "inventory_inventoryitem"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(list(InventoryItem.objects.order_by('pk').values_list('label', flat=True)), ['salmon', 'trout', 'trout', 'trout'])
+        self.assertEqual(self.counts(), [('salmon', TRAIN, 1), ('trout', TRAIN, 2), ('trout', VAL, 1)])
+        filenames, updates = backend.return_value.update_inventory_items.call_args.args
+        self.assertEqual((sorted(filenames), updates), (['images/1.jpg', 'images/2.jpg', 'images/3.jpg'], {'label': 'trout'}))
+
+    def test_view_only_staff_cannot_relabel(self, backend):
+        viewer = User.objects.create_user('viewer', is_staff=True)
+        viewer.user_permissions.add(Permission.objects.get(codename='view_inventoryitem'))
+        self.client.force_login(viewer)
+        self.post_action('relabel_selected', self.items, new_label='trout')
+        self.assertFalse(InventoryItem.objects.exclude(label='salmon').exists())
+        backend.assert_not_called()
+
+    def test_delete_asks_for_confirmation_first(self, backend):
+        response = self.post_action('delete_selected_everywhere', self.items[:2])
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'admin/inventory/inventoryitem/delete_selected_everywhere.html')
+        self.assertEqual(response.context['count'], 2)
+        self.assertContains(response, 'images/1.jpg')
+        self.assertContains(response, 'name="post" value="yes"')
+        self.assertEqual(InventoryItem.objects.count(), 4)
+        backend.assert_not_called()
+
+    def test_select_all_is_carried_through_the_confirmation(self, backend):
+        response = self.post_action('delete_selected_everywhere', self.items[:1], select_across='1')
+        self.assertEqual(response.context['count'], 4)
+        self.assertContains(response, 'name="select_across" value="1"')
+        self.assertEqual(InventoryItem.objects.count(), 4)
+
+    def test_confirmed_delete_removes_only_the_selection_everywhere(self, backend):
+        response = self.post_action('delete_selected_everywhere', [self.items[0], self.items[3]], post='yes')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(InventoryItem.objects.order_by('pk')), self.items[1:3])
+        self.assertEqual(self.counts(), [('salmon', TRAIN, 2)])
+        storage_backend = backend.return_value
+        self.assertEqual(sorted(storage_backend.delete_inventory_items.call_args.args[0]), ['images/0.jpg', 'images/3.jpg'])
+        self.assertEqual(sorted(storage_backend.delete_files.call_args.args[0]), ['images/0.jpg', 'images/3.jpg'])
+
+    def test_change_form_label_edit_is_synced(self, backend):
+        item = self.items[0]
+        response = self.client.post(f'{self.changelist_url}{item.pk}/change/', {'label': 'trout'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.counts(), [('salmon', TRAIN, 2), ('salmon', VAL, 1), ('trout', TRAIN, 1)])
+        backend.return_value.update_inventory_item.assert_called_once_with('images/0.jpg', {'label': 'trout'})
+
+    def test_change_form_delete_cleans_up_storage(self, backend):
+        item = self.items[3]
+        response = self.client.post(f'{self.changelist_url}{item.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(InventoryItem.objects.filter(pk=item.pk).exists())
+        self.assertEqual(self.counts(), [('salmon', TRAIN, 3)])
+        backend.return_value.delete_files.assert_called_once_with(['images/3.jpg'])
+
+
+class InMemoryAWSBackend:
+    """Local stand-in for AWSStorageBackend keeping the S3 objects and DynamoDB items in dicts."""
+
+    def __init__(self):
+        self.s3 = {} # key -> last modified datetime
+        self.dynamodb = {} # filename -> {'label': ..., 'timestamp': ISO string}
+
+    def scan_inventory_items(self, segment=0, total_segments=1):
+        for filename, item in list(self.dynamodb.items()):
+            if zlib.crc32(filename.encode()) % total_segments == segment:
+                yield filename, item['label'], item.get('timestamp')
+
+    def list_files(self, prefix='images/', start_after=None, end_before=None):
+        for key in sorted(self.s3):
+            if key.startswith(prefix) and (start_after is None or key > start_after) and (end_before is None or key < end_before):
+                yield key, self.s3[key]
+
+    def delete_files(self, filenames):
+        for filename in filenames:
+            del self.s3[filename]
+
+    def delete_inventory_items(self, filenames):
+        for filename in filenames:
+            del self.dynamodb[filename]
+
+    def create_inventory_items(self, items):
+        for item in items:
+            self.dynamodb[item['filename']] = {'label': item['label'], 'timestamp': item['timestamp'].isoformat()}
+
+    def update_inventory_items(self, filenames, updates):
+        for filename in filenames:
+            self.dynamodb[filename].update(updates)
+
+
+class ReconcileRepairTests(UserTestCase):
+    """reconcile_storage --repair only deletes orphans outside the grace period and never touches MISSING_S3 rows."""
+
+    def setUp(self):
+        self.old = datetime.now(timezone.utc) - timedelta(days=1)
+        self.now = datetime.now(timezone.utc)
+        self.backend = InMemoryAWSBackend()
+        self.user = User.objects.create_user('owner')
+
+    def add_row(self, filename, label='salmon', s3=True, dynamodb_label=None, created=None):
+        created = created or self.old
+        item = InventoryItem.objects.create(label=label, filename=filename, user=self.user)
+        InventoryItem.objects.filter(pk=item.pk).update(timestamp=created)
+        if s3:
+            self.backend.s3[filename] = created
+        if dynamodb_label is not None:
+            self.backend.dynamodb[filename] = {'label': dynamodb_label, 'timestamp': created.isoformat()}
+        return item
+
+    def run_command(self, *args):
+        stdout = io.StringIO()
+        with mock.patch('inventory.management.commands.reconcile_storage.AWSStorageBackend', return_value=self.backend):
+            call_command('reconcile_storage', '--segments', '3', '--s3-shards', '4', '--partitions', '4', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_repair(self):
+        self.add_row('images/ok.jpg', dynamodb_label='salmon')
+        missing_s3 = self.add_row('images/no-s3.jpg', s3=False, dynamodb_label='salmon')
+        self.add_row('images/no-dynamodb.jpg')
+        self.add_row('images/relabeled.jpg', label='trout', dynamodb_label='salmon')
+        self.add_row('images/uploading.jpg', created=self.now) # DynamoDB item not written yet
+        old_blank = self.add_row('', s3=False)
+        new_blank = self.add_row('', s3=False, created=self.now)
+        self.backend.s3['images/orphan.jpg'] = self.old
+        self.backend.s3['images/fresh.jpg'] = self.now
+        self.backend.dynamodb['images/orphan.jpg'] = {'label': 'crab', 'timestamp': self.old.isoformat()}
+        self.backend.dynamodb['images/fresh.jpg'] = {'label': 'crab', 'timestamp': self.now.isoformat()}
+
+        output = self.run_command('--repair')
+
+        self.assertEqual(sorted(self.backend.s3), [
+            'images/fresh.jpg', 'images/no-dynamodb.jpg', 'images/ok.jpg', 'images/relabeled.jpg', 'images/uploading.jpg',
+        ])
+        self.assertEqual({filename: item['label'] for filename, item in self.backend.dynamodb.items()}, {
+            'images/fresh.jpg': 'crab',
+            'images/no-dynamodb.jpg': 'salmon',
+            'images/no-s3.jpg': 'salmon',
+            'images/ok.jpg': 'salmon',
+            'images/relabeled.jpg': 'trout',
+        })
+        self.assertTrue(InventoryItem.objects.filter(pk=missing_s3.pk).exists()) # left for review
+        self.assertFalse(InventoryItem.objects.filter(pk=old_blank.pk).exists())
+        self.assertTrue(InventoryItem.objects.filter(pk=new_blank.pk).exists())
+        self.assertIn('Found 1 missing_s3', output)
+
+    def test_report_only_changes_nothing(self):
+        self.add_row('images/no-dynamodb.jpg')
+        self.backend.s3['images/orphan.jpg'] = self.old
+        output = self.run_command()
+        self.assertEqual(sorted(self.backend.s3), ['images/no-dynamodb.jpg', 'images/orphan.jpg'])
+        self.assertEqual(self.backend.dynamodb, {})
+        self.assertIn('Found 1 missing_dynamodb', output)
+        self.assertIn('Found 1 orphan_s3', output)
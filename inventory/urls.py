@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import views
+from . import views
 
 
 urlpatterns = [
-    path('inventory/', views.upload_image, name='inventory' )
-]
\ No newline at end of file
+    path('inventory/', views.upload_image, name='inventory' ),
+    path('inventory/images/<int:item_id>/', views.serve_image, name='inventory-image'),
+]
@@ -1,7 +1,20 @@
+import hashlib
+import logging
+import mimetypes
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.views.decorators.http import require_safe
+from django.http import FileResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags
+from .image_cache import get_image_cache
+from .image_validation import ImageValidationError, validate_image
 from .models import InventoryItem
 
+logger = logging.getLogger(__name__)
+
+# S3 keys are never reused, so an image at a given URL never changes and browsers may keep it for a year.
+# private: the images belong to the user who uploaded them, shared caches must not store them.
+IMAGE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
 @csrf_exempt
 def upload_image(request):
     """
@@ -25,13 +38,19 @@ def upload_image(request):
           # Check if the user is authenticated
         if not request.user.is_authenticated:
             return JsonResponse({'error': 'User not authenticated'}, status=401)
+
+        # Validate the image header before creating the item or sending anything to S3
+        try:
+            image_info = validate_image(image)
+        except ImageValidationError as e:
+            return JsonResponse({'error': str(e)}, status=e.status_code)
         
         # create model instance
         item = InventoryItem.objects.create(label=label, user=request.user) # assign logged-in user 
 
         # Handle image upload and DynamoDB entry
         try:
-            item.upload_image(image)
+            item.upload_image(image, image_info)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
 
@@ -41,4 +60,48 @@ def upload_image(request):
         }
         return JsonResponse(response_data)
     else:
-        return JsonResponse({'error': 'Invalid request method'}, status=405)
\ No newline at end of file
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+
+@require_safe
+def serve_image(request, item_id):
+    """
+    Serves an inventory item's image, or a thumbnail of it with ?thumbnail=1.
+
+    Images come from the local LocalImageCache, so only the first request for an image
+    reaches S3, and are streamed straight from disk with FileResponse (sendfile where the
+    server supports it). Conditional requests with a matching ETag get a 304 without
+    touching the cache at all.
+
+    Args:
+        request: The HTTP request object.
+        item_id: The primary key of the InventoryItem.
+
+    Returns:
+        FileResponse, HttpResponseNotModified or a JsonResponse describing the error.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'User not authenticated'}, status=401)
+
+    item = InventoryItem.objects.filter(pk=item_id).only('filename', 'user_id').first()
+    if item is None or not item.filename or (item.user_id != request.user.id and not request.user.is_staff):
+        return JsonResponse({'error': 'Image not found'}, status=404)
+
+    thumbnail = request.GET.get('thumbnail') == '1'
+    # the S3 key identifies the bytes for good, so the ETag can be derived without reading the file
+    etag = '"{}"'.format(hashlib.sha1(f'{item.filename}:{thumbnail}'.encode()).hexdigest())
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')) or request.META.get('HTTP_IF_NONE_MATCH') == '*':
+        response = HttpResponseNotModified()
+    else:
+        try:
+            file, size = get_image_cache().open(item.filename, thumbnail=thumbnail)
+        except Exception:
+            # the backend error names the bucket and key, keep it in the logs rather than the response
+            logger.exception('Could not fetch image for inventory item %s', item.pk)
+            return JsonResponse({'error': 'Image temporarily unavailable'}, status=502)
+        content_type = 'image/jpeg' if thumbnail else mimetypes.guess_type(item.filename)[0] or 'application/octet-stream'
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = size
+    response['ETag'] = etag
+    response['Cache-Control'] = IMAGE_CACHE_CONTROL
+    return response
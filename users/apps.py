@@ -15,7 +15,7 @@ class UsersConfig(AppConfig):
     name = 'users'
 
     def ready(self):
-         """
+        """
         Method called when the Django application is being initialized.
 
         This method is automatically called by Django during the startup process.
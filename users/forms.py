@@ -6,13 +6,18 @@ Key classes:
     - UserRegisterForm: Form for new user registration with password confirmation and email verification.
     - UserUpdateForm: Form for updating existing user accounts (username and email).
     - ProfileUpdateForm: Form for updating user profile information, including image uploads.
+    - CachedSelect: Select widget that caches its rendered HTML, used for the 50-state dropdown.
 Dependencies:
     - forms module from Django for creating form classes.
     - User and models module from Django for defining the User model.
     - Image, BytesIO, and ImageField from PIL (Python Imaging Library)"""
+import hashlib
 from django import forms
+from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth.models import User 
 from django.contrib.auth.forms import UserCreationForm
+from CCWebApp.context_processors import template_version
 from .models import Profile
 
 STATES = [
@@ -69,6 +74,30 @@ STATES = [
 ]
 
 
+class CachedSelect(forms.Select):
+    """Select widget that renders its options once and serves the HTML from the cache afterwards.
+
+    Rendering a 50-option select goes through the widget template once per option on every
+    form render. The output only depends on the field name, the selected value, the attributes
+    and the choices (and on the template version for the widget markup), so all of those go into
+    the cache key: editing the choices, a different selected value or a new release simply
+    produces a new key.
+    """
+    cache_prefix = 'users:select'
+
+    def _cache_key(self, name, value, attrs):
+        fingerprint = repr((name, value, sorted({**self.attrs, **(attrs or {})}.items()), list(self.choices)))
+        return f'{self.cache_prefix}:{template_version()}:{hashlib.md5(fingerprint.encode()).hexdigest()}'
+
+    def render(self, name, value, attrs=None, renderer=None):
+        key = self._cache_key(name, value, attrs)
+        html = cache.get(key)
+        if html is None:
+            html = super().render(name, value, attrs, renderer)
+            cache.set(key, html, getattr(settings, 'TEMPLATE_FRAGMENT_TIMEOUT', 60 * 60 * 24))
+        return html
+
+
 class UserRegisterForm(UserCreationForm):
     """Form for registering new users with password confirmation and email verification.
 
@@ -110,9 +139,9 @@ class UserRegisterForm(UserCreationForm):
         widget=forms.TextInput(attrs={'placeholder': 'Apartment, studio, or floor'})
     )
     city = forms.CharField()
-    state = forms.ChoiceField(label='State', choices=STATES) 
+    state = forms.ChoiceField(label='State', choices=STATES, widget=CachedSelect) 
     zip_code = forms.CharField(label='Zip')
-    phone = forms.IntegerField(blank=True, default=None, min_length=10, max_length=10)
+    phone = forms.IntegerField(required=False)
 
     class Meta:
         """Configures the model and fields for the UserRegisterForm.
@@ -195,9 +224,9 @@ class UserUpdateForm(forms.ModelForm):
         widget=forms.TextInput(attrs={'placeholder': 'Apartment, studio, or floor'})
     )
     city = forms.CharField()
-    state = forms.ChoiceField(label='State', choices=STATES)
+    state = forms.ChoiceField(label='State', choices=STATES, widget=CachedSelect)
     zip_code = forms.CharField(label='Zip')
-    phone = forms.IntegerField(null=True, min_length=10, max_length=10)
+    phone = forms.IntegerField(required=False)
     class Meta:
         """Configures the model and fields for the UserUpdateForm.
         - model: Specifies the User model as the basis for the form.
@@ -0,0 +1,19 @@
+"""
+The cached navigation bar and how to drop it.
+
+base.html caches the navigation bar per user with {% cache %}. Django builds its key from the
+fragment name and the vary-on values (the template version and user.pk), so the same
+make_template_fragment_key call finds and drops it here. signals.py calls invalidate_nav when a
+User is saved or deleted, because the bar shows the username.
+"""
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from CCWebApp.context_processors import template_version
+
+NAV_FRAGMENT = 'nav' # varies on the template version and user.pk
+
+
+def invalidate_nav(user_pk=None):
+    """Drops the cached navigation bar of one user (None is the anonymous visitor's bar)."""
+    cache.delete(make_template_fragment_key(NAV_FRAGMENT, [template_version(), user_pk]))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('user', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('image', models.ImageField(default='default.jpg', upload_to='profile_pics')),
+                ('firstname', models.CharField(max_length=255)),
+                ('lastname', models.CharField(max_length=255)),
+                ('address_1', models.CharField(max_length=255)),
+                ('address_2', models.CharField(max_length=255)),
+                ('city', models.CharField(max_length=255)),
+                ('state', models.CharField(max_length=255)),
+                ('zip_code', models.CharField(max_length=10)),
+                ('phone', models.IntegerField(null=True)),
+                ('joined_date', models.DateField(null=True)),
+            ],
+        ),
+    ]
@@ -9,7 +9,7 @@ from io import BytesIO
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import InMemoryUploadedFile
-from PIL import Image
+from CCWebApp.lazy_imports import pil_image # Pillow is imported when a profile image is first resized, not at startup
 
 class Profile(models.Model):
     """
@@ -37,7 +37,7 @@ class Profile(models.Model):
 
     def __str__(self):
         """ Returns a string representation of the user's profile"""
-        if self.user
+        if self.user:
             return f'{self.user.username} Profile ' 
         else:
             return f'Profile without user ({self.pk})'
@@ -53,7 +53,7 @@ class Profile(models.Model):
             **kwargs: Additional keyword arguments passed to the save method"""
         super(Profile, self).save(*args, **kwargs)
 
-        img = Image.open(self.image)
+        img = pil_image().open(self.image)
 
         if img.height > 300 or img.width > 300:
             output_size = (300, 300)
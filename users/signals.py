@@ -1,10 +1,12 @@
 """
 This module contains signal receivers that are responsible for creating and updating
-user profiles in sync with the creation and modification of User model instances.
+user profiles in sync with the creation and modification of User model instances,
+and for dropping the user's cached navigation bar when the user changes.
 """
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
+from .fragment_cache import invalidate_nav
 from .models import Profile
 
 
@@ -32,4 +34,12 @@ def save_profile(sender, instance, created, **kwargs):
     """
     instance.profile.save()
 
+@receiver([post_save, post_delete], sender=User)
+def invalidate_nav_fragment(sender, instance, **kwargs):
+    """
+    Drops the cached navigation bar of a saved or deleted User.
 
+    base.html caches the navigation bar per user and it shows the username, so it
+    has to be rendered again after the user is renamed (or its pk is reused).
+    """
+    invalidate_nav(instance.pk)